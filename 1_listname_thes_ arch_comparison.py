@@ -1,132 +1,42 @@
 # Import necessary libraries
 import pandas as pd
-import os
 import csv
-import openpyxl
-import numpy as np
-from difflib import get_close_matches
-
-# Define the data directory
-data_dir = os.path.join(os.getcwd(), "D:/University of Cambridge/ARCH_MAHSA - General/MAHSA_Database/Thesauri/Thesauri_Audit/Spreadsheets/")
-
-# Load the Excel workbook using openpyxl
-workbook_path = os.path.join('D:/University of Cambridge/ARCH_MAHSA - General/MAHSA_Database/Thesauri/MAHSA_Thesauri_v5.xlsx')
-
-workbook = openpyxl.load_workbook(workbook_path)
-
-# Print all sheet names for reference
-print("Original sheets:", workbook.sheetnames)
-
-# Save the "ODK Only" sheet separately (to be used when generating new ODK form)
-if 'ODK Only' in workbook.sheetnames:
-    odk_sheet = workbook['ODK Only']
-
-    # Create a new workbook and copy the ODK Only sheet into it
-    odk_wb = openpyxl.Workbook()
-    odk_ws = odk_wb.active
-    odk_ws.title = 'ODK Only'
-
-    # Copy contents cell by cell
-    for row in odk_sheet.iter_rows(values_only=False):
-        for cell in row:
-            odk_ws[cell.coordinate].value = cell.value
-
-    # Save this workbook separately
-    odk_only_path = os.path.join(data_dir, '1_Processing/excel_thesauri_ODK_only.xlsx')
-    odk_wb.save(odk_only_path)
-    print(f"Saved 'ODK Only' sheet to: {odk_only_path}")
-
-# Delete unnecessary sheets
-sheets_to_delete = [
-    'Temp Concept Sheet', 'Relationships', 'ODK Only', 'Guidelines',
-    'TempWorkSheet', 'PalaeolithicChronology (in prg)'
-]
-for sheet in sheets_to_delete:
-    del workbook[sheet]
-
-# Save the cleaned workbook
-processed_path = os.path.join(data_dir, '1_Processing/excel_thesauri_processed.xlsx')
-workbook.save(processed_path)
-
-# Read the processed workbook
-xls = pd.ExcelFile(processed_path)
-print("Sheets to process:", xls.sheet_names)
-
-# Collect all sheets into a list of DataFrames
-df_list = [pd.read_excel(processed_path, sheet_name=sheet, header=None) for sheet in xls.sheet_names]
-
-# Concatenate all sheets into a single DataFrame and remove any columns after column 7
-df = pd.concat(df_list, ignore_index=True)
-df = df.iloc[:, :8]
-
-# Create column 8: if column 0 is 'Resource Model Node', copy column 1; else empty string
-df[8] = np.where(df[0].isin(['Resource Model Node', 'CDB List Name']), df[1], '')
-
-# Create a separate DataFrame with unique list_names that had 'CDB List Name' in column 0
-cdb_listnames_df = (
-    df.loc[df[0] == 'CDB List Name', [1]]
-      .drop_duplicates()
-      .rename(columns={1: 'list_name'})
-)
-
-# Normalise CDB list names (replace spaces with underscores, lowercase)
-cdb_listnames_df['list_name'] = (
-    cdb_listnames_df['list_name']
-    .str.replace(' ', '_')
-    .str.lower()
-)
-
-# Forward-fill missing values in column 8
-df[8] = df[8].replace('', pd.NA).ffill()
-
-# Copy column 1 to column 9
-df[9] = df[1]
-
-# Create col10 with BI Name from thesauri where present, else NA
-df[10] = np.where(df[0] == 'BI Name', df[1], pd.NA)
-df[11] = np.where(df[0] == 'ODK List Name', df[1], pd.NA)
-
-# Forward-fill col10 within each group of col8
-df[10] = (
-    df.groupby(df[8])[10]
-      .apply(lambda g: g.ffill())
-      .reset_index(level=0, drop=True)
-)
-
-# Forward-fill col11 within each group of col8
-df[11] = (
-    df.groupby(df[8])[11]
-      .apply(lambda g: g.ffill())
-      .reset_index(level=0, drop=True)
-)
-
-# Fallback — if col10 is still empty/NaN, copy col8
-df[10] = df[10].fillna(df[8])
-
-# Replace blank strings in column 0 with NaN
-df[0] = df[0].replace('', pd.NA)
-
-# Drop rows where column 0 is in specific labels or both column 0 and 1 are NaN
-labels_to_drop = ['Resource Model Node', 'CDB List Name', 'ODK List Name', 'BI Name', 'Legacy Data Column', 'ODK Value']
-drop_condition = df[0].isin(labels_to_drop) | (df[0].isna() & df[1].isna())
-df = df.loc[~drop_condition].copy()
-
-# Transform column 8 and 10: replace spaces with underscores and lowercase
-df[8] = df[8].str.replace(' ', '_').str.lower()
-df[10] = df[10].str.replace(' ', '_').str.lower()
-
-# Replace 'NOT in ODK' with blank in column 11
-df[11] = df[11].astype(str).replace('Not in ODK', '')
-
-# Drop unnecessary columns (4 through 7)
-df.drop(df.columns[4:7], axis=1, inplace=True)
-
-# Rename columns to meaningful names
-df.columns = ["odk_value", "concept_key", "definition", "list_order", "ODK_multi", "list_name", "concept_value", "bulk_import", "ODK_list_name"]
-
-# Save the final DataFrame to CSV, quoting all values
-output_csv = os.path.join(data_dir, '1_Processing/excel_thesauri_processed.csv')
-df.to_csv(output_csv, index=False, quoting=csv.QUOTE_ALL)
+from fuzzy_match import CloseMatchIndex
+from thesauri_ingest import iter_thesauri_rows, SHEETS_TO_SKIP
+from thesauri_blocks import parse_thesauri_blocks, records_to_frame
+from artifacts import (apply_schema, artifact_path, save_artifact, review_exports_enabled, THESAURI_SCHEMA,
+                       ARCHES_SCHEMA, LIST_NAME_MATCHES_SCHEMA)
+from run_metrics import step
+from pipeline_options import batch_mode, check_nonmatch_limit, FORCED_LIST_NAMES, CLOSE_MATCH_CUTOFF
+from thesauri_paths import (THESAURI_WORKBOOK, ARCHES_EXPORT, ODK_ONLY_PATH, THESAURI_PROCESSED, ARCHES_PROCESSED,
+                            LIST_NAME_COMPARISON)
+
+# Thesauri workbook to process (folders are set in thesauri_paths.py)
+workbook_path = THESAURI_WORKBOOK
+
+# Read all list sheets in one read-only pass. The "ODK Only" sheet is saved separately on the way
+# (to be used when generating new ODK form) and the other unnecessary sheets are never loaded.
+odk_only_path = ODK_ONLY_PATH
+with step("parse workbook") as s:
+    rows = iter_thesauri_rows(workbook_path, skip_sheets=SHEETS_TO_SKIP, n_cols=8, odk_only_path=odk_only_path)
+
+    # Parse the marker rows (Resource Model Node / CDB List Name, BI Name, ODK List Name) into one
+    # record per concept, with list_name, bulk_import and ODK_list_name already resolved and normalised.
+    # Also returns the list names that had 'CDB List Name' in column 0 (normalised).
+    records, cdb_list_names = parse_thesauri_blocks(rows)
+    thesauri_df = apply_schema(records_to_frame(records), THESAURI_SCHEMA)
+    s.read(workbook_path)
+    s.rows_out = len(thesauri_df)
+
+# Save the final DataFrame as the typed processing artifact for script 2 (and as CSV for review, quoting all values)
+output_csv = THESAURI_PROCESSED
+with step("write processed thesauri", rows_in=len(thesauri_df)) as s:
+    save_artifact(thesauri_df, output_csv)
+    if review_exports_enabled():
+        thesauri_df.to_csv(output_csv, index=False, quoting=csv.QUOTE_ALL)
+    s.wrote(artifact_path(output_csv), output_csv)
+
+df = thesauri_df.copy()
 
 # =======================
 # Step 1: Sort thesauri CSV by 'list_name' then 'concept_value'
@@ -137,20 +47,21 @@ df.reset_index(drop=True, inplace=True)
 # =======================
 # Step 2: Read arches thesauri export
 # =======================
-arches_path = os.path.join(data_dir, 'arches_thesauri_export.xlsx')
-arches_df = pd.read_excel(arches_path)
+arches_path = ARCHES_EXPORT
+with step("read Arches export") as s:
+    arches_df = pd.read_excel(arches_path)
+    s.read(arches_path)
+    s.rows_out = len(arches_df)
 
 # =======================
-# FORCE INCLUDE IN ARCHES SPREADSHEET - Copy over artefacts_cultural_period* from thesauri_processed.csv
+# FORCE INCLUDE IN ARCHES SPREADSHEET - Copy over artefacts_cultural_period* from the processed thesauri
 # =======================
-thesauri_path = os.path.join(data_dir, '1_Processing/excel_thesauri_processed.csv')
-thesauri_df = pd.read_csv(thesauri_path)
 
 # Always include these fixed list names
-forced_list_names = ['artefacts_cultural_period', 'artefacts_cultural_period_certainity']
+forced_list_names = FORCED_LIST_NAMES
 
 # Combine with the CDB list names we captured earlier
-all_forced_list_names = forced_list_names + cdb_listnames_df['list_name'].tolist()
+all_forced_list_names = forced_list_names + cdb_list_names
 print(all_forced_list_names)
 
 # Filter thesauri for all lists to force include
@@ -168,13 +79,17 @@ forced_rows = pd.DataFrame({
 })
 
 # Append these to arches_df
-arches_df = pd.concat([arches_df, forced_rows], ignore_index=True)
+arches_df = apply_schema(pd.concat([arches_df, forced_rows], ignore_index=True), ARCHES_SCHEMA)
 
 # =======================
 # Step 3: Make a copy of the arches spreadsheet
 # =======================
-arches_processed_path = os.path.join(data_dir, '1_Processing/arches_thesauri_processed.xlsx')
-arches_df.to_excel(arches_processed_path, index=False)
+arches_processed_path = ARCHES_PROCESSED
+with step("write processed Arches", rows_in=len(arches_df)) as s:
+    save_artifact(arches_df, arches_processed_path)
+    if review_exports_enabled():
+        arches_df.to_excel(arches_processed_path, index=False)
+    s.wrote(artifact_path(arches_processed_path), arches_processed_path)
 
 # =======================
 # Step 4: Sort the copied arches spreadsheet by 'list_name' then 'concept_value'
@@ -213,26 +128,32 @@ thesauri_unmatched = thesauri_unique[~thesauri_unique['thesauri_list_name'].isin
 arches_unmatched = arches_unique[~arches_unique['arches_list_name'].isin(exact_matches['arches_list_name'])]
 
 # Function to find close match
-def find_close(value, choices):
-    matches = get_close_matches(value, choices, n=1, cutoff=0.8)  # cutoff=0.8 for similarity
-    return matches[0] if matches else pd.NA
+def find_close(value, index):
+    match = index.best_match(value)
+    return match if match is not None else pd.NA
 
-# Build DataFrame 4 for thesauri unmatched
-list_name_t_nm = thesauri_unmatched.copy()
-list_name_t_nm['arches_list_name'] = list_name_t_nm['thesauri_list_name'].apply(lambda x: find_close(x, arches_unmatched['arches_list_name'].tolist()))
-list_name_t_nm['close_match'] = list_name_t_nm['arches_list_name'].apply(lambda x: 'yes' if pd.notna(x) else 'no')
+with step("fuzzy match", rows_in=len(thesauri_unmatched) + len(arches_unmatched)) as s:
+    # Close-match indexes over the unmatched values of each side (same results as difflib.get_close_matches, cutoff=0.8)
+    arches_index = CloseMatchIndex(arches_unmatched['arches_list_name'], cutoff=CLOSE_MATCH_CUTOFF)
+    thesauri_index = CloseMatchIndex(thesauri_unmatched['thesauri_list_name'], cutoff=CLOSE_MATCH_CUTOFF)
 
-# =======================
-# Step 9: Close matches for arches unmatched values
-# =======================
-list_name_a_nm = arches_unmatched.copy()
-list_name_a_nm['thesauri_list_name'] = list_name_a_nm['arches_list_name'].apply(lambda x: find_close(x, thesauri_unmatched['thesauri_list_name'].tolist()))
-list_name_a_nm['close_match'] = list_name_a_nm['thesauri_list_name'].apply(lambda x: 'yes' if pd.notna(x) else 'no')
+    # Build DataFrame 4 for thesauri unmatched
+    list_name_t_nm = thesauri_unmatched.copy()
+    list_name_t_nm['arches_list_name'] = list_name_t_nm['thesauri_list_name'].apply(lambda x: find_close(x, arches_index))
+    list_name_t_nm['close_match'] = list_name_t_nm['arches_list_name'].apply(lambda x: 'yes' if pd.notna(x) else 'no')
+
+    # =======================
+    # Step 9: Close matches for arches unmatched values
+    # =======================
+    list_name_a_nm = arches_unmatched.copy()
+    list_name_a_nm['thesauri_list_name'] = list_name_a_nm['arches_list_name'].apply(lambda x: find_close(x, thesauri_index))
+    list_name_a_nm['close_match'] = list_name_a_nm['thesauri_list_name'].apply(lambda x: 'yes' if pd.notna(x) else 'no')
+    s.rows_out = len(list_name_t_nm) + len(list_name_a_nm)
 
 # =======================
 # Step 10: Create new Excel file with three tabs
 # =======================
-output_excel_path = os.path.join(data_dir, '2_Comparison/thesauri_arches_list_name_comparison.xlsx')
+output_excel_path = LIST_NAME_COMPARISON
 
 # Combine thesauri-only and arches-only non-matches into one DataFrame
 df_list_name_nm = pd.concat([list_name_t_nm, list_name_a_nm], ignore_index=True)
@@ -242,9 +163,14 @@ if "close_match" in df_list_name_nm.columns:
     df_list_name_nm = df_list_name_nm.sort_values(by="close_match", ascending=False)
 
 # Save two sheets instead of three
-with pd.ExcelWriter(output_excel_path, engine='openpyxl') as writer:
-    exact_matches.to_excel(writer, sheet_name='list_name_matches', index=False)
-    df_list_name_nm.to_excel(writer, sheet_name="list_name_nm", index=False)
+with step("write comparison", rows_in=len(exact_matches) + len(df_list_name_nm)) as s:
+    with pd.ExcelWriter(output_excel_path, engine='openpyxl') as writer:
+        exact_matches.to_excel(writer, sheet_name='list_name_matches', index=False)
+        df_list_name_nm.to_excel(writer, sheet_name="list_name_nm", index=False)
+
+    # Typed copy of the exact list_name matches for script 2
+    save_artifact(exact_matches, output_excel_path, LIST_NAME_MATCHES_SCHEMA)
+    s.wrote(output_excel_path, artifact_path(output_excel_path))
 
 # Print messages of counts of list names (matchign and not matching), and whether everything matches or not
 print("=" * 60)
@@ -264,4 +190,8 @@ if len(df_list_name_nm) > 0:
 else:
     print("=" * 60)
     print("✅ COMPLETE MATCH! Move onto the next step.")
-    print("=" * 60)
\ No newline at end of file
+    print("=" * 60)
+
+# Unattended runs stop here if too many list names do not match
+if batch_mode():
+    check_nonmatch_limit(len(df_list_name_nm), "THESAURI_MAX_LIST_NONMATCHES", "list names")
\ No newline at end of file
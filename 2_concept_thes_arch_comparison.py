@@ -4,226 +4,189 @@
 
 import pandas as pd
 import os
-from difflib import get_close_matches
+import sys
+from concept_compare import exact_concept_matches, incremental_close_matches, NON_MATCH_COLUMNS
+from concept_model import compact, load_concepts, share_categories
+from artifacts import (apply_schema, artifact_path, load_artifact, save_artifact, THESAURI_SCHEMA, ARCHES_SCHEMA,
+                       LIST_NAME_MATCHES_SCHEMA, COMPLETE_CONCEPTS_SCHEMA, CONCEPT_MATCH_STATE_SCHEMA)
+from run_metrics import step
+from pipeline_options import batch_mode, check_nonmatch_limit, FORCED_LIST_NAMES, CLOSE_MATCH_CUTOFF
+from thesauri_paths import (THESAURI_PROCESSED, ARCHES_PROCESSED, LIST_NAME_COMPARISON, CONCEPTS_COMPARISON,
+                            COMPLETE_CONCEPTS_DIR, CONCEPT_MATCH_STATE, complete_concepts_path)
 import datetime
 
 # =======================
-# Define data directory (adjust path if needed)
-# =======================
-data_dir = os.path.join(os.getcwd(), "D:/University of Cambridge/ARCH_MAHSA - General/MAHSA_Database/Thesauri/Thesauri_Audit/Spreadsheets/")
-
-# =======================
-# Input file paths
-# =======================
-thesauri_path = os.path.join(data_dir, '1_Processing/excel_thesauri_processed.csv')
-arches_processed_path = os.path.join(data_dir, '1_Processing/arches_thesauri_processed.xlsx')
-list_name_matches_path = os.path.join(data_dir, '2_Comparison/thesauri_arches_list_name_comparison.xlsx')
-
-# =======================
-# Load thesauri CSV (produced earlier)
-# =======================
-thesauri_df = pd.read_csv(thesauri_path)
-total_rows = len(thesauri_df)
-
-# =======================
-# Load arches processed Excel
-# =======================
-arches_df = pd.read_excel(arches_processed_path)
-
-# =======================
-# Load exact list_name matches (tab 'list_name_matches')
-# =======================
-exact_matches = pd.read_excel(list_name_matches_path, sheet_name='list_name_matches')
-
-# =======================
-# DataFrames to collect results
-# =======================
-concept_exact_matches = []
-concept_non_matches = []
-
-# =======================
-# Loop through each list_name that matched exactly
-# =======================
-for _, row in exact_matches.iterrows():
-    list_name = row['thesauri_list_name']  # same as arches_list_name
-
-    # Extract all concepts for this list_name
-    thesauri_sub = thesauri_df.loc[thesauri_df['list_name'] == list_name]
-    arches_sub = arches_df.loc[arches_df['list_name'] == list_name]
-
-    thesauri_concepts = thesauri_sub['concept_value'].dropna().unique()
-    arches_concepts = arches_sub['concept_key'].dropna().unique()
-
-    thesauri_set = set(thesauri_concepts)
-    arches_set = set(arches_concepts)
-
-    # --- Exact matches ---
-    exact_concepts = thesauri_set.intersection(arches_set)
-    for concept in exact_concepts:
-        t_row = thesauri_sub.loc[thesauri_sub['concept_value'] == concept].head(1)
-        a_row = arches_sub.loc[arches_sub['concept_key'] == concept].head(1)
-
-        concept_exact_matches.append({
-            'list_name': list_name,
-            'thesauri_concept_name': concept,
-            'arches_concept_name': concept,
-            'definition': t_row['definition'].values[0] if 'definition' in t_row else pd.NA,
-            'list_order': t_row['list_order'].values[0] if 'list_order' in t_row else pd.NA,
-            'concept_value': a_row['concept_value'].values[0] if 'concept_value' in a_row else pd.NA,
-            'sortorder': a_row['sortorder'].values[0] if 'sortorder' in a_row else pd.NA,
-            'bulk_import': t_row['bulk_import'].values[0] if 'bulk_import' in t_row else pd.NA,
-            'ODK_list_name': t_row['ODK_list_name'].values[0] if 'ODK_list_name' in t_row else pd.NA,
-            'ODK_multi': t_row['ODK_multi'].values[0] if 'ODK_multi' in t_row else pd.NA,
-            'odk_value': t_row['odk_value'].values[0] if 'odk_value' in t_row else pd.NA
-        })
-
-    # --- Remaining concepts not matched exactly ---
-    thesauri_unmatched = thesauri_set - exact_concepts
-    arches_unmatched = arches_set - exact_concepts
-
-    # Try to find close matches for thesauri_unmatched concepts
-    for concept in thesauri_unmatched:
-        close = get_close_matches(concept, list(arches_unmatched), n=1, cutoff=0.8)
-        if close:
-            concept_non_matches.append({
-                'list_name': list_name,
-                'thesauri_concept_name': concept,
-                'arches_concept_name': close[0],
-                'close_match': 'yes'
-            })
-            arches_unmatched.discard(close[0])
-        else:
-            concept_non_matches.append({
-                'list_name': list_name,
-                'thesauri_concept_name': concept,
-                'arches_concept_name': pd.NA,
-                'close_match': 'no'
-            })
-
-    # Handle arches concepts still unmatched
-    for concept in arches_unmatched:
-        close = get_close_matches(concept, list(thesauri_unmatched), n=1, cutoff=0.8)
-        if close:
-            concept_non_matches.append({
-                'list_name': list_name,
-                'thesauri_concept_name': close[0],
-                'arches_concept_name': concept,
-                'close_match': 'yes'
-            })
-            thesauri_unmatched.discard(close[0])
-        else:
-            concept_non_matches.append({
-                'list_name': list_name,
-                'thesauri_concept_name': pd.NA,
-                'arches_concept_name': concept,
-                'close_match': 'no'
-            })
-
-# =======================
-# Convert results to DataFrames (one with definition and bulk_import to be used later and one without)
-# =======================
-concept_exact_df_def = pd.DataFrame(
-    concept_exact_matches,
-    columns=['list_name', 'thesauri_concept_name', 'arches_concept_name', 'definition', 'list_order', 'concept_value',
-             'sortorder', 'bulk_import', 'ODK_list_name','ODK_multi','odk_value']
-)
-concept_exact_df = pd.DataFrame(
-    concept_exact_matches,
-    columns=['list_name', 'thesauri_concept_name', 'arches_concept_name', 'list_order', 'concept_value', 'sortorder']
-)
-concept_nm_df = pd.DataFrame(
-    concept_non_matches,
-    columns=['list_name', 'thesauri_concept_name', 'arches_concept_name', 'close_match']
-)
-
-thesauri_nm_count = concept_nm_df['thesauri_concept_name'].notna().sum()
-arches_nm_count = concept_nm_df['arches_concept_name'].notna().sum()
-
-# =======================
-# Save to Excel file
-# =======================
-concepts_output_path = os.path.join(data_dir, '2_Comparison/thesauri_arches_concepts_comparison.xlsx')
-with pd.ExcelWriter(concepts_output_path, engine='openpyxl') as writer:
-    concept_exact_df.to_excel(writer, sheet_name='concept_name_matches', index=False)
-    concept_nm_df.to_excel(writer, sheet_name='concept_name_nm', index=False)
-
-# Print messages of counts of list names (matchign and not matching), and whether everything matches or not
-print("=" * 60)
-print('Concept comparison completed')
-print("=" * 60)
-print(f"Thesauri unique concepts count with autopushed concepts: {total_rows}")
-# Handle the list_names that were pushed even though not Arches match
-countarc = thesauri_df[thesauri_df['list_name'].isin(['artefacts_cultural_period', 'artefacts_cultural_period_certainity'])].shape[0]
-print(f"Thesauri unique concepts autopushed even though not in Arches: {countarc}")
-count_minus_forced = total_rows - countarc
-arch_count_minus_forced = len(arches_df) - countarc
-
-print("=" * 60)
-print(f"Thesauri unique concepts count without autopushed values: {count_minus_forced}")
-print(f"Arches unique concepts count: {arch_count_minus_forced}")
-print("=" * 60)
-
-num_matches = len(concept_exact_df)
-print(f"Number of exact matches between thesauri and arches concept values: {num_matches}")
-total_unmatch_num = thesauri_nm_count + arches_nm_count
-print(f"Number of non-matches between thesauri and arches concept values: {total_unmatch_num}")
-print(f"             - Only in thesauri: {thesauri_nm_count}")
-print(f"             - Only in Arches: {arches_nm_count}")
-
-if total_unmatch_num > 0:
+# Input file paths (folders are set in thesauri_paths.py; the typed .parquet artifact
+# next to each file is read when it exists)
+# =======================
+thesauri_path = THESAURI_PROCESSED
+arches_processed_path = ARCHES_PROCESSED
+list_name_matches_path = LIST_NAME_COMPARISON
+
+# =======================
+# Number of worker processes for the close-match stage (1 = serial, in this process)
+# =======================
+compare_workers = int(os.getenv("THESAURI_COMPARE_WORKERS", "1"))
+
+
+def main():
+    # =======================
+    # Load processed thesauri (produced earlier), with compact key columns (see concept_model.py)
+    # =======================
+    with step("load processed files") as s:
+        thesauri_df = load_concepts(thesauri_path, THESAURI_SCHEMA)
+        total_rows = len(thesauri_df)
+
+        # =======================
+        # Load arches processed
+        # =======================
+        arches_df = compact(load_artifact(arches_processed_path, ARCHES_SCHEMA))
+
+        # Same list_name codes on both sides, so the keyed merge compares integers
+        share_categories([thesauri_df, arches_df])
+
+        # =======================
+        # Load exact list_name matches (tab 'list_name_matches')
+        # =======================
+        exact_matches = load_artifact(list_name_matches_path, LIST_NAME_MATCHES_SCHEMA)
+        s.read(*(artifact_path(p) for p in (thesauri_path, arches_processed_path, list_name_matches_path)))
+        s.rows_out = len(thesauri_df) + len(arches_df)
+
+    # =======================
+    # Exact matches: one keyed merge of (list_name, concept_value) <-> (list_name, concept_key)
+    # over every list_name that matched exactly (one with definition and bulk_import to be used later and one without)
+    # =======================
+    matched_list_names = exact_matches['thesauri_list_name'].tolist()  # same as arches_list_name
+
+    with step("exact match", rows_in=len(thesauri_df) + len(arches_df)) as s:
+        concept_exact_df_def, thesauri_unmatched_by_list, arches_unmatched_by_list = exact_concept_matches(
+            thesauri_df, arches_df, matched_list_names
+        )
+        s.rows_out = len(concept_exact_df_def)
+    concept_exact_df = concept_exact_df_def[['list_name', 'thesauri_concept_name', 'arches_concept_name', 'list_order',
+                                             'concept_value', 'sortorder']]
+
+    # =======================
+    # Close matches for the concepts left over in each list_name
+    # =======================
+    # Each list_name is independent, so with compare_workers > 1 they are spread over worker processes.
+    # Results are merged back in list_name order, so the output is the same as a serial run.
+    jobs = [
+        (list_name, thesauri_unmatched_by_list.get(list_name, set()), arches_unmatched_by_list.get(list_name, set()))
+        for list_name in matched_list_names
+    ]
+
+    # Lists whose unmatched concepts are the same as in the previous run reuse that run's rows
+    with step("fuzzy match", rows_in=sum(len(t) + len(a) for _, t, a in jobs)) as s:
+        previous_state = load_artifact(CONCEPT_MATCH_STATE) if os.path.exists(CONCEPT_MATCH_STATE) else None
+        concept_non_matches, match_state, reused_lists = incremental_close_matches(
+            jobs, previous_state, cutoff=CLOSE_MATCH_CUTOFF, workers=compare_workers
+        )
+        save_artifact(match_state, CONCEPT_MATCH_STATE, CONCEPT_MATCH_STATE_SCHEMA)
+        s.rows_out = len(concept_non_matches)
+    print(f"Close matches reused from the previous run for {reused_lists} of {len(jobs)} list names")
+
+    concept_nm_df = pd.DataFrame(concept_non_matches, columns=NON_MATCH_COLUMNS)
+
+    thesauri_nm_count = concept_nm_df['thesauri_concept_name'].notna().sum()
+    arches_nm_count = concept_nm_df['arches_concept_name'].notna().sum()
+
+    # =======================
+    # Save to Excel file
+    # =======================
+    concepts_output_path = CONCEPTS_COMPARISON
+    with step("write comparison", rows_in=len(concept_exact_df) + len(concept_nm_df)) as s:
+        with pd.ExcelWriter(concepts_output_path, engine='openpyxl') as writer:
+            concept_exact_df.to_excel(writer, sheet_name='concept_name_matches', index=False)
+            concept_nm_df.to_excel(writer, sheet_name='concept_name_nm', index=False)
+        s.wrote(concepts_output_path)
+
+    # Print messages of counts of list names (matchign and not matching), and whether everything matches or not
     print("=" * 60)
-    print("⚠️  NOT ALL CONCEPTS MATCH ⚠️")
-    print(f"Check the output file for details:\n{concepts_output_path}")
+    print('Concept comparison completed')
     print("=" * 60)
-else:
+    print(f"Thesauri unique concepts count with autopushed concepts: {total_rows}")
+    # Handle the list_names that were pushed even though not Arches match
+    countarc = thesauri_df[thesauri_df['list_name'].isin(FORCED_LIST_NAMES)].shape[0]
+    print(f"Thesauri unique concepts autopushed even though not in Arches: {countarc}")
+    count_minus_forced = total_rows - countarc
+    arch_count_minus_forced = len(arches_df) - countarc
+
     print("=" * 60)
-    print("✅ COMPLETE MATCH! Move onto the next step.")
+    print(f"Thesauri unique concepts count without autopushed values: {count_minus_forced}")
+    print(f"Arches unique concepts count: {arch_count_minus_forced}")
     print("=" * 60)
 
-# =======================
-# Pause to confirm continuation
-# =======================
-while True:
-    user_input = input("Do you want to continue and create the complete thesauri concepts CSV? (Y/N): ").strip().upper()
-
-    if user_input == "Y":
-        print("✅ Continuing with the next step...")
-        break  # Exit the loop and continue the script
-    elif user_input == "N":
-        print("❌ Stopping script. Please make changes and run again.")
-        exit()  # Stop the script immediately
+    num_matches = len(concept_exact_df)
+    print(f"Number of exact matches between thesauri and arches concept values: {num_matches}")
+    total_unmatch_num = thesauri_nm_count + arches_nm_count
+    print(f"Number of non-matches between thesauri and arches concept values: {total_unmatch_num}")
+    print(f"             - Only in thesauri: {thesauri_nm_count}")
+    print(f"             - Only in Arches: {arches_nm_count}")
+
+    if total_unmatch_num > 0:
+        print("=" * 60)
+        print("⚠️  NOT ALL CONCEPTS MATCH ⚠️")
+        print(f"Check the output file for details:\n{concepts_output_path}")
+        print("=" * 60)
     else:
-        print("⚠️ Invalid input. Please type Y to continue or N to stop.")
-
-# =======================
-# Save additional CSV (complete thesauri concepts)
-# =======================
-today = datetime.datetime.today().strftime("%Y%m%d")
-csv_output_dir = r"D:\University of Cambridge\ARCH_MAHSA - General\MAHSA_Database\Thesauri\Thesauri_Audit\Spreadsheets\3_Complete_concepts"
-os.makedirs(csv_output_dir, exist_ok=True)
-
-csv_output_path = os.path.join(csv_output_dir, f"complete_thesauri_concepts_{today}.csv")
-
-# Reformat exact matches dataframe
-csv_export_df = concept_exact_df_def.rename(columns={'arches_concept_name': 'concept_key'})
-csv_export_df = csv_export_df[['list_name', 'concept_value', 'concept_key', 'sortorder', 'list_order', 'definition',
-                               'bulk_import', 'ODK_list_name', 'ODK_multi', 'odk_value']]
-
-# Ensure list_order is numeric where possible (blanks stay NaN)
-csv_export_df['list_order'] = pd.to_numeric(csv_export_df['list_order'], errors='coerce')
-
-# Sort priority:
-# 1. list_name
-# 2. list_order (put non-nulls first, then nulls)
-# 3. concept_value (for rows where list_order is missing)
-csv_export_df = csv_export_df.sort_values(
-    by=['list_name', 'list_order', 'concept_value'],
-    na_position='last'
-)
-
-# Add ascending id column starting at 1
-csv_export_df['id'] = range(1, len(csv_export_df) + 1)
-
-# Save CSV
-csv_export_df.to_csv(csv_output_path, index=False, encoding="utf-8-sig")
-print('Complete thesauri concepts CSV saved to', csv_output_path)
\ No newline at end of file
+        print("=" * 60)
+        print("✅ COMPLETE MATCH! Move onto the next step.")
+        print("=" * 60)
+
+    # =======================
+    # Pause to confirm continuation (unattended runs check the non-match limit instead)
+    # =======================
+    if batch_mode():
+        check_nonmatch_limit(total_unmatch_num, "THESAURI_MAX_NONMATCHES", "concepts")
+    else:
+        while True:
+            user_input = input("Do you want to continue and create the complete thesauri concepts CSV? (Y/N): ").strip().upper()
+
+            if user_input == "Y":
+                print("✅ Continuing with the next step...")
+                break  # Exit the loop and continue the script
+            elif user_input == "N":
+                print("❌ Stopping script (stopped by user). Please make changes and run again.")
+                # Non-zero, so the runner does not go on to script 3 (there is no complete concepts CSV)
+                sys.exit(1)
+            else:
+                print("⚠️ Invalid input. Please type Y to continue or N to stop.")
+
+    # =======================
+    # Save additional CSV (complete thesauri concepts)
+    # =======================
+    today = datetime.datetime.today().strftime("%Y%m%d")
+    os.makedirs(COMPLETE_CONCEPTS_DIR, exist_ok=True)
+
+    csv_output_path = complete_concepts_path(today)
+
+    # Reformat exact matches dataframe
+    csv_export_df = concept_exact_df_def.rename(columns={'arches_concept_name': 'concept_key'})
+    csv_export_df = csv_export_df[['list_name', 'concept_value', 'concept_key', 'sortorder', 'list_order', 'definition',
+                                   'bulk_import', 'ODK_list_name', 'ODK_multi', 'odk_value']]
+
+    # Sort priority:
+    # 1. list_name
+    # 2. list_order (put non-nulls first, then nulls)
+    # 3. concept_value (for rows where list_order is missing)
+    csv_export_df = csv_export_df.sort_values(
+        by=['list_name', 'list_order', 'concept_value'],
+        na_position='last'
+    )
+
+    # Add ascending id column starting at 1
+    csv_export_df['id'] = range(1, len(csv_export_df) + 1)
+    csv_export_df = apply_schema(csv_export_df, COMPLETE_CONCEPTS_SCHEMA)
+
+    # Save the typed artifact (read by scripts 3, 5 and 6) and the CSV
+    with step("write complete concepts", rows_in=len(csv_export_df)) as s:
+        save_artifact(csv_export_df, csv_output_path)
+        csv_export_df.to_csv(csv_output_path, index=False, encoding="utf-8-sig")
+        s.wrote(artifact_path(csv_output_path), csv_output_path)
+    print('Complete thesauri concepts CSV saved to', csv_output_path)
+
+
+# The guard is needed for the worker processes: on Windows they re-import this file
+if __name__ == "__main__":
+    main()
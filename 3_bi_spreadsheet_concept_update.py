@@ -1,9 +1,12 @@
-import os, re, shutil, datetime
-import pandas as pd
-import xlwings as xw
+import os, re, datetime
+from artifacts import artifact_path, latest_complete_concepts
+from concept_model import load_concepts
+from run_metrics import step
+from thesauri_paths import BULKIMPORT_DIR, COMPLETE_CONCEPTS_DIR
+from xlsx_sheet_writer import replace_sheet
 
-bulkimport_dir = r"D:\University of Cambridge\ARCH_MAHSA - General\MAHSA_Database\Thesauri\Thesauri_Audit\Spreadsheets\4_Updated_MAHSA_BulkImport"
-complete_concepts_dir = r"D:\University of Cambridge\ARCH_MAHSA - General\MAHSA_Database\Thesauri\Thesauri_Audit\Spreadsheets\3_Complete_concepts"
+bulkimport_dir = BULKIMPORT_DIR
+complete_concepts_dir = COMPLETE_CONCEPTS_DIR
 
 # 1) find latest MASTER_MAHSA_BulkImport_Template_V12_YYYYMMDD_N.xlsm
 pattern = re.compile(r"MASTER_MAHSA_BulkImport_Template_V12_(\d{8})_(\d+)\.xlsm$")
@@ -24,45 +27,22 @@ new_num = latest_num + 1
 new_file = f"MASTER_MAHSA_BulkImport_Template_V12_{today_str}_{new_num}.xlsm"
 new_path = os.path.join(bulkimport_dir, new_file)
 
-# 3) copy the file (binary copy preserves macros, etc.)
-shutil.copy2(latest_path, new_path)
-print("Copied", latest_file, "->", new_file)
-
-# 4) find latest complete_thesauri_concepts_YYYYMMDD.csv
-csv_pattern = re.compile(r"complete_thesauri_concepts_(\d{8})\.csv$")
-csv_candidates = []
-for f in os.listdir(complete_concepts_dir):
-    m = csv_pattern.match(f)
-    if m:
-        csv_candidates.append((f, m.group(1)))
-if not csv_candidates:
-    raise FileNotFoundError("No complete_thesauri_concepts_*.csv found.")
-csv_candidates.sort(key=lambda x: x[1])
-csv_name, csv_date = csv_candidates[-1]
-csv_path = os.path.join(complete_concepts_dir, csv_name)
+# 3) find latest complete_thesauri_concepts_YYYYMMDD (typed artifact, or the CSV for older runs)
+csv_path = latest_complete_concepts(complete_concepts_dir)
+csv_name = os.path.basename(csv_path)
 print("Using CSV:", csv_name)
 
-df = pd.read_csv(csv_path, dtype=str)  # read all as str to avoid formatting surprises
-
-# 5) open the copy in Excel and replace Full_DropDowns contents using xlwings
-app = xw.App(visible=False)     # set visible=True if you want to watch it
-try:
-    wb = app.books.open(new_path)
-    if "Full_DropDowns" not in [s.name for s in wb.sheets]:
-        raise KeyError("Full_DropDowns sheet not found in workbook.")
-    sht = wb.sheets["Full_DropDowns"]
-
-    # Clear existing *contents* (keeps formatting). Use .clear() if you want to remove formats too.
-    sht.clear_contents()
-
-    # Write headers + data starting at A1 (index=False so pandas index isn't written)
-    sht.range("A1").options(index=False).value = df
-
-    # Force Excel to recalculate (optional but useful for dynamic arrays)
-    app.api.CalculateFull()  # full recalculation
-
-    wb.save()
-    print("Updated Full_DropDowns and saved", new_file)
-finally:
-    wb.close()
-    app.quit()
\ No newline at end of file
+with step("read complete concepts") as s:
+    df = load_concepts(csv_path)  # typed, compact columns, text stays text; blanks become empty cells
+    s.read(artifact_path(csv_path))
+    s.rows_out = len(df)
+
+# 4) write the copy with Full_DropDowns replaced. Only that sheet's cells are rewritten inside the
+#    .xlsm package, so macros, other sheets and the sheet's formatting are kept, and Excel does
+#    not need to be installed. Excel recalculates all formulas when the copy is next opened.
+with step("write Full_DropDowns", rows_in=len(df)) as s:
+    replace_sheet(latest_path, "Full_DropDowns", df, new_path, recalculate=True)
+    s.read(latest_path)
+    s.wrote(new_path)
+print("Copied", latest_file, "->", new_file)
+print("Updated Full_DropDowns and saved", new_file)
@@ -1,44 +1,31 @@
 import os
-from dotenv import load_dotenv, find_dotenv
-import psycopg2
 import pandas as pd
-
-# Load .env from the project root (find_dotenv is robust across run locations)
-load_dotenv(find_dotenv())
-
-# Read credentials
-dbname = os.getenv("DB_NAME")
-user = os.getenv("DB_USER")
-password = os.getenv("DB_PASSWORD")
-host = os.getenv("DB_HOST")
-port = os.getenv("DB_PORT")
-
-# Optional: fail fast if anything is missing
-missing = [k for k in ["DB_NAME","DB_USER","DB_PASSWORD","DB_HOST","DB_PORT"] if not os.getenv(k)]
-if missing:
-    raise RuntimeError(f"Missing required env vars: {', '.join(missing)}. "
-                       f"Did you create your .env or set your Run/Debug working directory?")
-
-# Connect
-conn = psycopg2.connect(
-    dbname=dbname,
-    user=user,
-    password=password,
-    host=host,
-    port=port
-)
-
-# Pull the entire table public.mahsa_thesauri into a DataFrame
-dfcdb = pd.read_sql("SELECT * FROM public.mahsa_thesauri;", conn)
-with pd.option_context('display.max_columns', None):
-    print(dfcdb.head())
-
-# Close the connection
-conn.close()
-
-# Save the DataFrame as a CSV
-output_path = r"D:\University of Cambridge\ARCH_MAHSA - General\MAHSA_Database\Thesauri\Thesauri_Audit\Spreadsheets\1_Processing\CDB_thesauri_processed.csv"
-dfcdb.to_csv(output_path, index=False)
-
-print(f"CSV saved successfully to: {output_path}")
-
+from cdb_export import probe_cdb, print_probe, export_table_csv
+from cdb_session import get_connection, release
+from run_metrics import step
+from thesauri_paths import CDB_PROCESSED
+
+# Connect (credentials come from the .env file, see cdb_session.py). The connection goes back to
+# the pool however the script ends.
+conn = get_connection()
+try:
+    # Connection check: version, latency and table statistics, without reading the table
+    with step("probe CDB"):
+        probe = probe_cdb(conn, "public.mahsa_thesauri")
+    print_probe(probe)
+    if not probe["exists"]:
+        raise RuntimeError("public.mahsa_thesauri not found on the CDB.")
+
+    # Export public.mahsa_thesauri straight to CSV (THESAURI_CDB_EXPORT=0 to only run the check)
+    output_path = CDB_PROCESSED
+    if os.getenv("THESAURI_CDB_EXPORT", "1").strip().lower() not in ("0", "no", "false"):
+        with step("COPY export") as s:
+            rows = export_table_csv(conn, "public.mahsa_thesauri", output_path, order_by="id")
+            s.rows_out = rows
+            s.wrote(output_path)
+        with pd.option_context('display.max_columns', None):
+            print(pd.read_csv(output_path, nrows=5))
+        print(f"CSV with {rows} rows saved successfully to: {output_path}")
+finally:
+    # Return the connection
+    release(conn)
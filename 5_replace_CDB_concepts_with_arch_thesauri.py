@@ -1,91 +1,100 @@
-import os, re
-from dotenv import load_dotenv, find_dotenv
-import psycopg2
+import os
 import pandas as pd
-
-# Load .env
-load_dotenv(find_dotenv())
+from artifacts import artifact_path, latest_complete_concepts
+from cdb_session import get_connection, release
+from cdb_load import column_lengths, delta_upsert, load_staging
+from cdb_snapshots import (live_version, prune_snapshots, record_load, replace_new_version, snapshot_changes,
+                           swap_new_version)
+from concept_model import load_concepts
+from concept_validation import check_concepts
+from odk_choices import odk_only_list_names
+from pipeline_options import cdb_delta_key, cdb_load_mode, cdb_snapshots_to_keep
+from run_metrics import step
+from thesauri_paths import COMPLETE_CONCEPTS_DIR, ODK_ONLY_PATH
 
 # Load concepts directory
-complete_concepts_dir = r"D:\University of Cambridge\ARCH_MAHSA - General\MAHSA_Database\Thesauri\Thesauri_Audit\Spreadsheets\3_Complete_concepts"
-
-# Read credentials
-dbname = os.getenv("DB_NAME")
-user = os.getenv("DB_USER")
-password = os.getenv("DB_PASSWORD")
-host = os.getenv("DB_HOST")
-port = os.getenv("DB_PORT")
-
-# Connect to Postgres
-conn = psycopg2.connect(
-    dbname=dbname,
-    user=user,
-    password=password,
-    host=host,
-    port=port
-)
-cur = conn.cursor()
+complete_concepts_dir = COMPLETE_CONCEPTS_DIR
 
-# Find latest complete_thesauri_concepts_YYYYMMDD.csv
-csv_pattern = re.compile(r"complete_thesauri_concepts_(\d{8})\.csv$")
-csv_candidates = []
-for f in os.listdir(complete_concepts_dir):
-    m = csv_pattern.match(f)
-    if m:
-        csv_candidates.append((f, m.group(1)))
-if not csv_candidates:
-    raise FileNotFoundError("No complete_thesauri_concepts_*.csv found.")
-csv_candidates.sort(key=lambda x: x[1])
-csv_name, csv_date = csv_candidates[-1]
-csv_path = os.path.join(complete_concepts_dir, csv_name)
+# Find latest complete_thesauri_concepts_YYYYMMDD (typed artifact, or the CSV for older runs)
+csv_path = latest_complete_concepts(complete_concepts_dir)
+csv_name = os.path.basename(csv_path)
 print("Using CSV:", csv_name)
 
 print(csv_path)
 
-# Copy current mahsa_thesauri on the CDB to the mahsa_thesauri_backup in case something goes wrong.
-# Delete current backup
-cur.execute("DELETE FROM public.mahsa_thesauri_backup;")
-conn.commit()
-print("All rows deleted from mahsa_thesauri_backup.")
-
-# Copy over current mahsa_thesauri values to backup
-cur.execute("""
-    INSERT INTO public.mahsa_thesauri_backup
-    (id, concept_key, concept_value, definition, list_name, bulk_import)
-    SELECT id, concept_key, concept_value, definition, list_name, bulk_import
-    FROM public.mahsa_thesauri;
-""")
-conn.commit()
-print("All rows copied from mahsa_thesauri to mahsa_thesauri_backup.")
-
-# Add new concepts to mahsa_thesauri
-# Step 1: Delete all existing rows from test table
-cur.execute("DELETE FROM public.mahsa_thesauri;")
-conn.commit()
-print("All existing rows deleted from mahsa_thesauri.")
-
-# Step 2: Load CSV
-df_csv = pd.read_csv(csv_path, dtype=str)  # read all as str to avoid formatting surprises
+# Load complete concepts
+with step("read complete concepts") as s:
+    df_csv = load_concepts(csv_path)  # typed, compact columns, text stays text
+    s.read(artifact_path(csv_path))
+    s.rows_out = len(df_csv)
 
-# Step 3: Keep only the columns that match the Postgres table
-df_csv = df_csv[["id", "concept_key", "concept_value", "definition", "list_name", "bulk_import"]]
-
-# Replace NaN/empty strings with None so psycopg2 inserts NULL
-df_csv = df_csv.where(pd.notnull(df_csv), None)
-df_csv = df_csv.replace('', None)
-
-# Step 4: Insert rows into test table
-insert_query = """
-    INSERT INTO public.mahsa_thesauri (id, concept_key, concept_value, definition, list_name, bulk_import)
-    VALUES (%s, %s, %s, %s, %s, %s);
-"""
-
-for row in df_csv.itertuples(index=False, name=None):
-    cur.execute(insert_query, row)
-
-conn.commit()
-print(f"Inserted {len(df_csv)} rows into mahsa_thesauri.")
-
-# Close connection
-cur.close()
-conn.close()
\ No newline at end of file
+# Connect to Postgres (credentials come from the .env file, see cdb_session.py).
+# Every statement is timed and gives up after the statement/lock timeouts.
+# The connection goes back to the pool however the script ends, also when a check stops it.
+conn = get_connection()
+cur = conn.cursor()
+try:
+    # Refuse to load concepts that fail the integrity checks (see concept_validation.py), before
+    # anything is written to the CDB. Values must fit the columns of mahsa_thesauri.
+    with step("validate concepts", rows_in=len(df_csv)):
+        lengths = column_lengths(cur, "public.mahsa_thesauri")
+        conn.commit()  # ends the transaction of the catalog query
+        odk_only_lists = odk_only_list_names(ODK_ONLY_PATH) if os.path.exists(ODK_ONLY_PATH) else set()
+        check_concepts(df_csv, odk_only_lists, lengths)
+
+    # Each load is recorded as a version of mahsa_thesauri; the replaced contents are kept as a
+    # snapshot table (mahsa_thesauri_v<N>) and only the newest ones are kept. See cdb_snapshots.py.
+    load_mode = cdb_load_mode()
+    snapshots_to_keep = cdb_snapshots_to_keep()
+
+    if load_mode == "swap":
+        # Load and check a staging table first; mahsa_thesauri stays readable and complete until the
+        # staging table is renamed to it. The old table is renamed to its snapshot, without copying rows.
+        with step("staging load", rows_in=len(df_csv)) as s:
+            method = load_staging(conn, df_csv)
+            s.rows_out = len(df_csv)
+        with step("swap"):
+            version, snapshot = swap_new_version(conn, csv_name, len(df_csv), keep=snapshots_to_keep)
+        print(f"Loaded {len(df_csv)} rows into mahsa_thesauri_staging ({method}) and swapped it with mahsa_thesauri "
+              f"(version {version}). The previous mahsa_thesauri is now {snapshot}.")
+    elif load_mode == "delta":
+        # Only the changed concepts are written, in one transaction with the snapshot of the rows they
+        # replace (the old contents get a version first if they have none yet).
+        delta_key = cdb_delta_key()
+        snapshots = []
+
+        def record_new_version(c):
+            snapshots.append(snapshot_changes(c))
+            record_load(c, "public.mahsa_thesauri", csv_name, len(df_csv))
+            prune_snapshots(c, keep=snapshots_to_keep)
+
+        with step("delta load", rows_in=len(df_csv)) as s:
+            changes, method = delta_upsert(conn, df_csv, key=delta_key,
+                                           before_write=live_version, after_write=record_new_version)
+            s.rows_out = sum(sum(c.values()) for c in changes.values())
+        if changes:
+            summary = pd.DataFrame.from_dict(changes, orient="index").sort_index()
+            summary.index.name = "list_name"
+            with pd.option_context('display.max_rows', None):
+                print(summary)
+            totals = summary.sum()
+            print(f"mahsa_thesauri updated by {', '.join(delta_key)} ({method}): {totals['inserted']} inserted, "
+                  f"{totals['updated']} updated, {totals['deleted']} deleted, "
+                  f"{len(df_csv) - totals['inserted'] - totals['updated']} unchanged. "
+                  f"The replaced rows are kept in {snapshots[0]}.")
+        else:
+            print("mahsa_thesauri already matches the complete concepts. Nothing changed.")
+    else:
+        # Keep the current mahsa_thesauri as a snapshot, delete its rows and load the new concepts,
+        # in one transaction: if the load fails, mahsa_thesauri keeps its current contents.
+        # COPY streams all rows in one statement (NaN/empty strings become NULL); batched INSERTs are
+        # used if COPY is not allowed.
+        with step("COPY load", rows_in=len(df_csv)) as s:
+            version, snapshot, method = replace_new_version(conn, df_csv, csv_name, keep=snapshots_to_keep)
+            s.rows_out = len(df_csv)
+        print(f"All rows copied from mahsa_thesauri to {snapshot}, then replaced.")
+        print(f"Inserted {len(df_csv)} rows into mahsa_thesauri ({method}, version {version}).")
+finally:
+    # Return the connection
+    cur.close()
+    release(conn)
@@ -0,0 +1,168 @@
+# =======================
+# Typed, columnar intermediate files passed between the pipeline scripts
+# =======================
+#
+# Processing artifacts are written as Parquet with a fixed column schema, so strings stay
+# strings and list_order / sortorder / id stay numbers between scripts. The CSV / XLSX files
+# written next to them are for people to review and can be switched off with
+# THESAURI_REVIEW_EXPORTS=0. Files only useful for debugging a stage (such as the choices
+# tables of script 6) are written only with THESAURI_DEBUG_EXPORTS=1.
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+ARTIFACT_EXT = '.parquet'
+
+# Column schemas ('string', 'number' or a pandas dtype name)
+THESAURI_SCHEMA = {
+    'odk_value': 'string', 'concept_key': 'string', 'definition': 'string', 'list_order': 'number',
+    'ODK_multi': 'string', 'list_name': 'string', 'concept_value': 'string', 'bulk_import': 'string',
+    'ODK_list_name': 'string',
+}
+ARCHES_SCHEMA = {
+    'list_name': 'string', 'parentid': 'string', 'concept_value': 'string', 'concept_key': 'string',
+    'relationshiptype': 'string', 'sortorder': 'number', 'arches_conceptid': 'string',
+}
+LIST_NAME_MATCHES_SCHEMA = {
+    'thesauri_list_name': 'string', 'arches_list_name': 'string', 'exact_match': 'string',
+}
+CONCEPT_MATCH_STATE_SCHEMA = {
+    'list_name': 'string', 'thesauri_concept_name': 'string', 'arches_concept_name': 'string',
+    'close_match': 'string', 'list_digest': 'string',
+}
+COMPLETE_CONCEPTS_SCHEMA = {
+    'list_name': 'string', 'concept_value': 'string', 'concept_key': 'string', 'sortorder': 'number',
+    'list_order': 'number', 'definition': 'string', 'bulk_import': 'string', 'ODK_list_name': 'string',
+    'ODK_multi': 'string', 'odk_value': 'string', 'id': 'Int64',
+}
+
+COMPLETE_CONCEPTS_PATTERN = re.compile(r"complete_thesauri_concepts_(\d{8})\.(csv|parquet)$")
+
+# Frames saved in this process, by artifact path. Only kept when the stages run in one
+# process (the pipeline runner turns it on), so a stage reads the previous stage's frame
+# from memory instead of parsing the file again.
+_memory = None
+
+
+def keep_in_memory(enabled=True):
+    """Keep saved artifacts in memory for later load_artifact calls in this process."""
+    global _memory
+    _memory = {} if enabled else None
+
+
+def review_exports_enabled():
+    """True unless THESAURI_REVIEW_EXPORTS is set to 0 / no / false."""
+    return os.getenv("THESAURI_REVIEW_EXPORTS", "1").strip().lower() not in ("0", "no", "false")
+
+
+def debug_exports_enabled():
+    """True when THESAURI_DEBUG_EXPORTS is set to 1 / yes / true (off by default)."""
+    return os.getenv("THESAURI_DEBUG_EXPORTS", "").strip().lower() in ("1", "yes", "true")
+
+
+class BackgroundWriter:
+    """
+    Saves files on one background thread, in the order they are submitted, so the stage can go
+    on while they are written. close() (or the end of a with block) waits for them and raises
+    the first error. The frames passed in must not be changed afterwards.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="file-writer")
+        self._pending = []
+
+    def submit(self, write, *args, **kwargs):
+        """Call write(*args, **kwargs) on the writer thread."""
+        self._pending.append(self._executor.submit(write, *args, **kwargs))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Let the files finish, but report the stage's own error
+            self._executor.shutdown(wait=True)
+
+
+def _to_number(series):
+    numbers = pd.to_numeric(series, errors='coerce')
+    try:
+        return numbers.astype('Int64')
+    except (TypeError, ValueError):
+        # Some values have decimals
+        return numbers.astype('Float64')
+
+
+def apply_schema(df, schema):
+    """Return df with the schema columns (in schema order) converted to their types."""
+    df = df.reindex(columns=list(schema)).copy()
+    for col, kind in schema.items():
+        if kind == 'string':
+            # Blank strings are missing values, as they were when read back from CSV
+            values = df[col].astype(object)
+            values = values.where(values.isna(), values.astype(str))
+            df[col] = values.astype('string').replace('', pd.NA)
+        elif kind == 'number':
+            df[col] = _to_number(df[col])
+        else:
+            df[col] = df[col].astype(kind)
+    return df
+
+
+def artifact_path(path):
+    """Swap the extension of path for the artifact extension."""
+    return os.path.splitext(path)[0] + ARTIFACT_EXT
+
+
+def save_artifact(df, path, schema=None):
+    """Write df (converted to schema, if given) as a Parquet artifact and return its path."""
+    if schema is not None:
+        df = apply_schema(df, schema)
+    path = artifact_path(path)
+    df.to_parquet(path, index=False)
+    if _memory is not None:
+        _memory[os.path.abspath(path)] = df.copy()
+    return path
+
+
+def load_artifact(path, schema=None):
+    """
+    Read an artifact written by save_artifact. If there is no Parquet file for path (older runs),
+    the CSV / XLSX file at path is read instead and converted to schema.
+    """
+    parquet_path = artifact_path(path)
+    if _memory is not None and os.path.abspath(parquet_path) in _memory:
+        return _memory[os.path.abspath(parquet_path)].copy()
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path)
+
+    if path.lower().endswith('.csv'):
+        df = pd.read_csv(path)
+    else:
+        df = pd.read_excel(path)
+    return apply_schema(df, schema) if schema is not None else df
+
+
+def latest_complete_concepts(directory):
+    """Path of the latest complete_thesauri_concepts_YYYYMMDD file in directory (the .csv name)."""
+    candidates = []
+    for f in os.listdir(directory):
+        m = COMPLETE_CONCEPTS_PATTERN.match(f)
+        if m:
+            candidates.append((f"complete_thesauri_concepts_{m.group(1)}.csv", m.group(1)))
+    if not candidates:
+        raise FileNotFoundError("No complete_thesauri_concepts_*.csv found.")
+    candidates.sort(key=lambda x: x[1])
+    csv_name, _ = candidates[-1]
+    return os.path.join(directory, csv_name)
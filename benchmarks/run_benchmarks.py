@@ -0,0 +1,208 @@
+# =======================
+# Scaling benchmark of the thesauri update scripts on synthetic inputs
+# =======================
+#
+# For each size, synthetic inputs are written once (benchmarks/synthetic_data.py), then each
+# script runs in its own process on a fresh copy of them, in batch mode. Wall time, CPU time
+# and peak memory (max RSS) of every script are recorded in a JSON file. Linux only: the
+# figures come from os.wait4.
+#
+# Usage:
+#   python benchmarks/run_benchmarks.py --sizes 1000 10000 100000 1000000 --output results.json
+#   python benchmarks/run_benchmarks.py --sizes 1000 10000 --baseline results.json   (fails on regressions)
+#
+# Scripts 4 and 5 read and replace mahsa_thesauri on the CDB set in .env, so they only run
+# with --with-cdb (point .env at a scratch database first).
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import synthetic_data
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# Script number: (stage name, script file)
+STAGES = {
+    1: ("list name comparison", "1_listname_thes_ arch_comparison.py"),
+    2: ("concept comparison", "2_concept_thes_arch_comparison.py"),
+    3: ("bulk import template", "3_bi_spreadsheet_concept_update.py"),
+    4: ("CDB export", "4_list_concepts_in_CDB.py"),
+    5: ("CDB load", "5_replace_CDB_concepts_with_arch_thesauri.py"),
+    6: ("ODK form build", "6_ODK_sheet_creator.py"),
+}
+CDB_STAGES = (4, 5)
+
+# Wall time or peak memory over baseline * MAX_SLOWDOWN is a regression
+MAX_SLOWDOWN = 1.25
+# Differences smaller than this are timer noise, never a regression
+MIN_SECONDS = 0.5
+
+
+def stage_env(root):
+    """Environment of the scripts: inputs under root, no prompts, no stop on non-matches."""
+    env = dict(os.environ)
+    env.update({
+        "MAHSA_DATABASE_DIR": root,
+        "THESAURI_BATCH": "1",
+        "THESAURI_MAX_LIST_NONMATCHES": str(10 ** 9),
+        "THESAURI_MAX_NONMATCHES": str(10 ** 9),
+        "THESAURI_DB_LOG": "0",
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def run_stage(script, env, log_path):
+    """Run one script in a child process. Returns its exit code, wall time, CPU time and peak RSS."""
+    with open(log_path, "w", encoding="utf-8") as log:
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, script)], cwd=REPO_DIR, env=env,
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "exit_code": process.returncode,
+        "wall_s": round(wall, 3),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+    }
+
+
+def _tail(path, lines=20):
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return "".join(f.readlines()[-lines:])
+
+
+def benchmark_size(n_concepts, stages, work_dir, seed, repeat):
+    """Generate the inputs for one size and time the stages on them. Returns (inputs summary, results)."""
+    data_dir = os.path.join(work_dir, f"data_{n_concepts}")
+    shutil.rmtree(data_dir, ignore_errors=True)
+    started = time.perf_counter()
+    summary = synthetic_data.generate(data_dir, n_concepts, seed=seed)
+    summary["generate_s"] = round(time.perf_counter() - started, 3)
+    print(f"Generated {n_concepts} concepts in {summary['generate_s']} s")
+
+    results = []
+    for run in range(1, repeat + 1):
+        # Each run starts from the inputs alone, so no stage reuses the outputs of an earlier run
+        run_dir = os.path.join(work_dir, f"run_{n_concepts}")
+        shutil.rmtree(run_dir, ignore_errors=True)
+        shutil.copytree(data_dir, run_dir)
+        env = stage_env(run_dir)
+        for number in stages:
+            name, script = STAGES[number]
+            log_path = os.path.join(work_dir, f"{n_concepts}_{number}_{run}.log")
+            result = run_stage(script, env, log_path)
+            result.update({"concepts": n_concepts, "stage": number, "name": name, "run": run})
+            results.append(result)
+            print(f"  {n_concepts:>8} concepts  script {number} ({name}): {result['wall_s']:.2f} s wall, "
+                  f"{result['cpu_s']:.2f} s CPU, {result['peak_rss_mb']:.0f} MB peak")
+            if result["exit_code"] != 0:
+                print(f"  Script {number} failed (exit code {result['exit_code']}). Last lines of {log_path}:")
+                print(_tail(log_path))
+                # The later stages need its outputs
+                return summary, results
+    return summary, results
+
+
+def best_results(results):
+    """Fastest successful run of each (concepts, stage)."""
+    best = {}
+    for r in results:
+        key = (r["concepts"], r["stage"])
+        if r["exit_code"] == 0 and (key not in best or r["wall_s"] < best[key]["wall_s"]):
+            best[key] = r
+    return best
+
+
+def regressions(report, baseline, max_slowdown=MAX_SLOWDOWN):
+    """Stages slower or bigger than in the baseline report by more than max_slowdown."""
+    found = []
+    old = best_results(baseline["results"])
+    for key, new in best_results(report["results"]).items():
+        if key not in old:
+            continue
+        for measure in ("wall_s", "peak_rss_mb"):
+            before, after = old[key][measure], new[measure]
+            if after > before * max_slowdown and (measure != "wall_s" or after - before > MIN_SECONDS):
+                found.append(f"{key[0]} concepts, script {key[1]} ({new['name']}): {measure} {before} -> {after}")
+    return found
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time the thesauri update scripts on synthetic inputs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Numbers of thesauri concepts to test (default 1000 10000 100000 1000000).")
+    parser.add_argument("--stages", type=int, nargs="+", choices=sorted(STAGES),
+                        help="Scripts to time, in order (default 1 2 3 6, plus 4 5 with --with-cdb).")
+    parser.add_argument("--with-cdb", action="store_true",
+                        help="Also time scripts 4 and 5. They replace mahsa_thesauri on the CDB set in .env.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per size (default 1); all are recorded.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic inputs (default 0).")
+    parser.add_argument("--work-dir", help="Folder for the inputs, outputs and logs (default: a temporary folder).")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON report to write.")
+    parser.add_argument("--baseline", help="Earlier JSON report. Exit with code 1 if a stage got slower or bigger.")
+    parser.add_argument("--max-slowdown", type=float, default=MAX_SLOWDOWN,
+                        help="Allowed ratio to the baseline before it counts as a regression (default 1.25).")
+    args = parser.parse_args(argv)
+    if args.stages is None:
+        args.stages = sorted(STAGES) if args.with_cdb else [s for s in sorted(STAGES) if s not in CDB_STAGES]
+    elif not args.with_cdb and any(s in CDB_STAGES for s in args.stages):
+        parser.error("scripts 4 and 5 need --with-cdb")
+    return args
+
+
+def main(argv=None):
+    if not hasattr(os, "wait4"):
+        sys.exit("The benchmarks need os.wait4 (Linux or macOS).")
+    args = parse_args(argv)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="thesauri_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    print(f"Working folder: {work_dir}")
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "inputs": [],
+        "results": [],
+    }
+    for n_concepts in args.sizes:
+        summary, results = benchmark_size(n_concepts, args.stages, work_dir, args.seed, args.repeat)
+        report["inputs"].append(summary)
+        report["results"].extend(results)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {args.output}")
+
+    failed = [r for r in report["results"] if r["exit_code"] != 0]
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(report, json.load(f), args.max_slowdown)
+        for line in found:
+            print(f"❌ Regression: {line}")
+        if not found:
+            print("✅ No regressions against the baseline.")
+        failed = failed or found
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# =======================
+# Synthetic MAHSA_Database inputs for benchmarking the thesauri update scripts
+# =======================
+#
+# Writes a folder laid out like MAHSA_Database (see thesauri_paths.py) with every input the
+# scripts read, at any size:
+#   - the thesauri workbook, one block per list in the layout script 1 parses
+#     (Resource Model Node / CDB List Name, BI Name, ODK List Name, ODK Value header, concepts),
+#     spread over several sheets, plus the 'ODK Only' sheet and the sheets script 1 skips
+#   - the Arches export, matching the thesauri except for a controlled share of near-miss and
+#     missing list names and concepts
+#   - the Person-Organization sheet of the common bulk import workbook
+#   - a bulk import template (Full_DropDowns) and a master ODK form to be updated
+#
+# Usage: python benchmarks/synthetic_data.py <output folder> --concepts 100000
+
+import argparse
+import os
+import random
+import sys
+
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import thesauri_paths  # noqa: E402
+from thesauri_ingest import SHEETS_TO_SKIP  # noqa: E402
+
+CONCEPTS_PER_LIST = 50
+LISTS_PER_SHEET = 200
+NEAR_MISS_RATE = 0.05
+MISSING_RATE = 0.02
+
+WORDS = ["heritage", "site", "feature", "pottery", "period", "material", "condition", "threat", "survey",
+         "structure", "burial", "landscape", "water", "defence", "religious", "settlement", "route", "method",
+         "certainty", "function", "form", "shape", "decoration", "disturbance", "vegetation", "access"]
+MULTI_VALUES = ["archaeological", "built", "landscape", "underwater", "movable"]
+TEMPLATE_DATE = "20250101"
+
+# Output folders the scripts expect to exist
+OUTPUT_DIRS = [thesauri_paths.PROCESSING_DIR, thesauri_paths.COMPARISON_DIR, thesauri_paths.COMPLETE_CONCEPTS_DIR,
+               thesauri_paths.BULKIMPORT_DIR, thesauri_paths.ODK_CHOICES_DIR, thesauri_paths.ODK_MASTER_FORM_DIR]
+
+
+def relative_path(path):
+    """Path of a thesauri_paths location inside the MAHSA_Database folder."""
+    return os.path.relpath(path, thesauri_paths.MAHSA_DATABASE_DIR)
+
+
+def near_miss(text, rng):
+    """text with one letter changed, dropped or doubled, so it is a close but not an exact match."""
+    positions = [i for i, c in enumerate(text) if c.isalpha()]
+    i = rng.choice(positions)
+    edit = rng.randrange(3)
+    if edit == 0:
+        return text[:i] + ("x" if text[i] != "x" else "y") + text[i + 1:]
+    if edit == 1:
+        return text[:i] + text[i + 1:]
+    return text[:i] + text[i] + text[i:]
+
+
+def _list_names(n_lists, rng):
+    names = []
+    for i in range(n_lists):
+        words = rng.sample(WORDS, 2)
+        names.append(f"{words[0].title()} {words[1]} {i:05d}")
+    return names
+
+
+def _save(wb, root, path):
+    full_path = os.path.join(root, relative_path(path))
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    wb.save(full_path)
+    return full_path
+
+
+def write_thesauri(root, lists, odk_only_lists, rng):
+    """Thesauri workbook: the list blocks, LISTS_PER_SHEET to a sheet, then 'ODK Only' and the skipped sheets."""
+    wb = openpyxl.Workbook(write_only=True)
+    for start in range(0, len(lists), LISTS_PER_SHEET):
+        ws = wb.create_sheet(f"Lists {start // LISTS_PER_SHEET + 1}")
+        for lst in lists[start:start + LISTS_PER_SHEET]:
+            ws.append(["CDB List Name" if lst["cdb"] else "Resource Model Node", lst["name"]])
+            ws.append(["BI Name", lst["bi_name"]])
+            ws.append(["ODK List Name", lst["odk_list_name"]])
+            ws.append(["ODK Value", "Concept", "Definition", "List Order", None, None, None, "ODK Multi List"])
+            for concept in lst["concepts"]:
+                ws.append([concept["odk_value"], concept["name"], concept["definition"], concept["order"],
+                           None, None, None, concept["multi"]])
+            ws.append([])
+
+    ws = wb.create_sheet("ODK Only")
+    for name, n_choices in odk_only_lists:
+        ws.append(["ODK List Name", name])
+        ws.append(["ODK Name", "ODK Label", "ODK Image File", "ODK Filter", "ODK Multi List"])
+        for j in range(n_choices):
+            multi = rng.choice([None, None, rng.choice(MULTI_VALUES), ", ".join(rng.sample(MULTI_VALUES, 2))])
+            ws.append([f"{name}_{j}", f"{name.replace('_', ' ').title()} {j}", None, None, multi])
+        ws.append([])
+
+    for sheet in SHEETS_TO_SKIP:
+        if sheet != "ODK Only":
+            wb.create_sheet(sheet).append(["Not a thesaurus list"])
+    return _save(wb, root, thesauri_paths.THESAURI_WORKBOOK)
+
+
+def write_arches_export(root, lists, rng, near_miss_rate, missing_rate):
+    """Arches export of the same lists, with near-miss and missing list names and concepts."""
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(["list_name", "parentid", "concept_value", "concept_key", "relationshiptype", "sortorder",
+               "arches_conceptid"])
+    for i, lst in enumerate(lists):
+        if lst["cdb"] or rng.random() < missing_rate:
+            continue
+        list_name = lst["name"].replace(" ", "_").lower()
+        if rng.random() < near_miss_rate:
+            list_name = near_miss(list_name, rng)
+        for j, concept in enumerate(lst["concepts"]):
+            if rng.random() < missing_rate:
+                continue
+            key = near_miss(concept["name"], rng) if rng.random() < near_miss_rate else concept["name"]
+            ws.append([list_name, f"parent-{i}", f"concept-{i}-{j}", key, "narrower", j + 1, f"arches-{i}-{j}"])
+        # A concept only in Arches
+        if rng.random() < missing_rate:
+            ws.append([list_name, f"parent-{i}", f"concept-{i}-extra", f"Arches only {i}", "narrower", 0,
+                       f"arches-{i}-extra"])
+    return _save(wb, root, thesauri_paths.ARCHES_EXPORT)
+
+
+def write_person_organization(root, n_people, rng):
+    """Common bulk import workbook with the 'Person-Organization RM' sheet (3 rows before the header)."""
+    n_institutes = max(3, n_people // 25)
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Person-Organization RM")
+    for _ in range(3):
+        ws.append(["Person-Organization resource model"])
+    ws.append(["MAHSA_ID", "Name", "Related Organization", "KOBO Account", "ODK Institute Name"])
+    for i in range(n_institutes):
+        words = rng.sample(WORDS, 2)
+        name = f"{words[0].title()} {words[1].title()} Institute {i}"
+        ws.append([f"MAHSA-ORG-{i:05d}", name, None, "No", name.lower().replace(" ", "_")])
+    for i in range(n_people):
+        institute = f"MAHSA-ORG-{rng.randrange(n_institutes):05d}" if rng.random() < 0.95 else None
+        ws.append([f"MAHSA-PER-{i:06d}", f"Person {rng.randrange(n_people):06d}", institute,
+                   "Yes" if rng.random() < 0.8 else "No", None])
+    return _save(wb, root, thesauri_paths.COMMON_BULK_IMPORT)
+
+
+def write_templates(root):
+    """Bulk import template (Full_DropDowns) and master ODK form, as scripts 3 and 6 find them."""
+    wb = openpyxl.Workbook()
+    wb.active.title = "Instructions"
+    wb.active["A1"] = "Bulk import template"
+    wb.active["A2"] = "=COUNTA(Full_DropDowns!A:A)"
+    dropdowns = wb.create_sheet("Full_DropDowns")
+    dropdowns.append(["list_name", "concept_value"])
+    dropdowns.append(["old_list", "Old concept"])
+    template = os.path.join(thesauri_paths.BULKIMPORT_DIR,
+                            f"MASTER_MAHSA_BulkImport_Template_V12_{TEMPLATE_DATE}_1.xlsm")
+    _save(wb, root, template)
+
+    wb = openpyxl.Workbook()
+    wb.active.title = "survey"
+    wb.active.append(["type", "name", "label"])
+    wb.active.append(["select_one recorder_list", "recorder", "Recorder"])
+    choices = wb.create_sheet("choices")
+    choices.append(["list_name", "name", "label"])
+    choices.append(["old_list", "old", "Old choice"])
+    settings = wb.create_sheet("settings")
+    settings.append(["form_title", "form_id"])
+    settings.append(["MAHSA Site Form", "mahsa_site"])
+    form = os.path.join(thesauri_paths.ODK_MASTER_FORM_DIR, f"MAHSA_Site_Form_V21_{TEMPLATE_DATE}_1.xlsx")
+    _save(wb, root, form)
+
+
+def generate(root, n_concepts, seed=0, near_miss_rate=NEAR_MISS_RATE, missing_rate=MISSING_RATE,
+             concepts_per_list=CONCEPTS_PER_LIST):
+    """
+    Write a synthetic MAHSA_Database folder at root with about n_concepts thesauri concepts.
+    Returns a summary dict (sizes and settings).
+    """
+    rng = random.Random(seed)
+    n_lists = max(1, -(-n_concepts // concepts_per_list))
+    names = _list_names(n_lists, rng)
+    odk_names = [f"odk_{name.split()[-1]}" for name in names]
+
+    lists = []
+    remaining = n_concepts
+    for i, name in enumerate(names):
+        size = min(concepts_per_list, remaining)
+        remaining -= size
+        roll = rng.random()
+        if roll < 0.3:
+            odk_list_name = "Not in ODK"
+        elif roll < 0.4:
+            odk_list_name = f"{odk_names[i]}, {rng.choice(odk_names)}"
+        else:
+            odk_list_name = odk_names[i]
+        concepts = []
+        for j in range(size):
+            r = rng.random()
+            concepts.append({
+                "odk_value": f"{odk_names[i]}_{j}" if r < 0.98 else None,
+                "name": f"{name} concept {j:03d}",
+                "definition": f"Definition of concept {j} of {name}" if r < 0.9 else None,
+                "order": j + 1 if r < 0.95 else None,
+                "multi": (rng.choice(MULTI_VALUES) if r < 0.2
+                          else ", ".join(rng.sample(MULTI_VALUES, 2)) if r < 0.25 else None),
+            })
+        lists.append({
+            "name": name,
+            "cdb": rng.random() < 0.02,
+            "bi_name": name if rng.random() < 0.8 else f"{name} BI",
+            "odk_list_name": odk_list_name,
+            "concepts": concepts,
+        })
+        if lists[-1]["bi_name"] != name:
+            # Lists with their own BI Name need every definition (see concept_validation.py)
+            for j, concept in enumerate(concepts):
+                concept["definition"] = concept["definition"] or f"Definition of concept {j} of {name}"
+
+    # ODK Only lists: some extend thesauri ODK lists, the others are new
+    n_odk_only = max(2, n_lists // 20)
+    odk_only_lists = [(rng.choice(odk_names) if k % 2 else f"odk_only_{k:04d}", rng.randint(2, 12))
+                      for k in range(n_odk_only)]
+    n_people = max(50, n_concepts // 50)
+
+    write_thesauri(root, lists, odk_only_lists, rng)
+    write_arches_export(root, lists, rng, near_miss_rate, missing_rate)
+    write_person_organization(root, n_people, rng)
+    write_templates(root)
+    for directory in OUTPUT_DIRS:
+        os.makedirs(os.path.join(root, relative_path(directory)), exist_ok=True)
+    return {
+        "concepts": n_concepts, "lists": n_lists, "odk_only_lists": n_odk_only, "people": n_people,
+        "seed": seed, "near_miss_rate": near_miss_rate, "missing_rate": missing_rate,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic inputs for the thesauri update scripts.")
+    parser.add_argument("root", help="Folder to use as MAHSA_DATABASE_DIR.")
+    parser.add_argument("--concepts", type=int, default=10000, help="Number of thesauri concepts (default 10000).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default 0).")
+    parser.add_argument("--near-miss-rate", type=float, default=NEAR_MISS_RATE,
+                        help="Share of Arches list names and concepts with a one-letter difference (default 0.05).")
+    parser.add_argument("--missing-rate", type=float, default=MISSING_RATE,
+                        help="Share of lists and concepts missing from the Arches export (default 0.02).")
+    args = parser.parse_args(argv)
+    summary = generate(args.root, args.concepts, args.seed, args.near_miss_rate, args.missing_rate)
+    print(f"Synthetic inputs written to {args.root}: {summary}")
+
+
+if __name__ == "__main__":
+    main()
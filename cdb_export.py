@@ -0,0 +1,78 @@
+# =======================
+# Connectivity check and export of CDB tables
+# =======================
+
+import csv
+import os
+import time
+
+from psycopg2 import sql
+
+from cdb_load import table_identifier
+
+
+def probe_cdb(conn, table="public.mahsa_thesauri"):
+    """
+    Cheap health check: server version, round-trip latency, and the table's row estimate and
+    activity statistics from the catalog (nothing is scanned). Returns a dict.
+    """
+    with conn.cursor() as cur:
+        started = time.perf_counter()
+        cur.execute("SELECT 1;")
+        cur.fetchone()
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        cur.execute("SHOW server_version;")
+        version = cur.fetchone()[0]
+
+        cur.execute("""
+            SELECT s.n_live_tup, s.n_tup_ins, s.n_tup_upd, s.n_tup_del,
+                   greatest(s.last_vacuum, s.last_autovacuum), greatest(s.last_analyze, s.last_autoanalyze),
+                   pg_total_relation_size(c.oid)
+            FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE c.oid = to_regclass(%s);
+        """, (table,))
+        stats = cur.fetchone()
+    conn.rollback()  # leave no transaction open
+
+    result = {"server_version": version, "latency_ms": round(latency_ms, 1), "table": table,
+              "exists": stats is not None}
+    if stats:
+        keys = ["rows_estimate", "rows_inserted", "rows_updated", "rows_deleted",
+                "last_vacuum", "last_analyze", "total_bytes"]
+        result.update(dict(zip(keys, stats)))
+    return result
+
+
+def print_probe(result):
+    print(f"Connected to PostgreSQL {result['server_version']} (round trip {result['latency_ms']} ms).")
+    if not result["exists"]:
+        print(f"❌ Table {result['table']} not found.")
+        return
+    print(f"{result['table']}: about {result['rows_estimate']} rows (estimate from the table statistics, not a count), "
+          f"{result['total_bytes'] / 1024:.0f} kB. "
+          f"Since the statistics were reset: {result['rows_inserted']} inserted, {result['rows_updated']} updated, "
+          f"{result['rows_deleted']} deleted. Last vacuum {result['last_vacuum'] or 'never'}, "
+          f"last analyze {result['last_analyze'] or 'never'}.")
+
+
+def export_table_csv(conn, table, output_path, order_by=None):
+    """
+    Stream table to a CSV file with a header row using COPY ... TO STDOUT, so memory use does not
+    grow with the table. Returns the number of rows written.
+    """
+    query = sql.SQL("SELECT * FROM {}").format(table_identifier(table))
+    if order_by:
+        query += sql.SQL(" ORDER BY {}").format(sql.Identifier(order_by))
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with conn.cursor() as cur, open(output_path, "w", encoding="utf-8", newline="") as f:
+        cur.copy_expert(sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)").format(query), f)
+    conn.rollback()
+    return count_csv_rows(output_path)
+
+
+def count_csv_rows(path):
+    """Number of records in a CSV file after its header row (quoted values may span lines), read as a stream."""
+    with open(path, encoding="utf-8", newline="") as f:
+        return max(sum(1 for _ in csv.reader(f)) - 1, 0)
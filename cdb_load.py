@@ -0,0 +1,367 @@
+# =======================
+# Bulk loading of thesaurus concepts into the CDB (PostgreSQL)
+# =======================
+
+import csv
+import io
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+# Columns of public.mahsa_thesauri filled from the complete concepts
+MAHSA_THESAURI_COLUMNS = ["id", "concept_key", "concept_value", "definition", "list_name", "bulk_import"]
+
+
+def table_identifier(table):
+    """sql.Identifier for 'schema.table' or 'table'."""
+    return sql.Identifier(*table.split("."))
+
+
+def _csv_buffer(rows):
+    # csv.writer writes None as an unquoted empty field, which COPY's CSV format reads as NULL
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    buffer.seek(0)
+    return buffer
+
+
+def copy_rows(cur, table, columns, rows):
+    """Stream rows (tuples, None for NULL) into table with COPY ... FROM STDIN."""
+    query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        table_identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+    )
+    cur.copy_expert(query, _csv_buffer(rows))
+
+
+def insert_rows(cur, table, columns, rows, page_size=1000):
+    """Insert rows in batches of page_size with execute_values."""
+    query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+        table_identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+    )
+    execute_values(cur, query, rows, page_size=page_size)
+
+
+def frame_rows(df, columns):
+    """Rows of df[columns] as tuples of Python values, with None for missing values and empty strings."""
+    values = df[columns].astype(object)
+    values = values.where(values.notna(), None).replace('', None)
+    return list(values.itertuples(index=False, name=None))
+
+
+def column_lengths(cur, table="public.mahsa_thesauri", columns=MAHSA_THESAURI_COLUMNS):
+    """Maximum length of the columns of table that have one (varchar(n) / char(n)), by column name."""
+    schema, name = split_table(table)
+    cur.execute("""
+        SELECT column_name, character_maximum_length FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND character_maximum_length IS NOT NULL;
+    """, (schema, name))
+    return {column: length for column, length in cur.fetchall() if column in columns}
+
+
+def bulk_load(cur, df, table="public.mahsa_thesauri", columns=MAHSA_THESAURI_COLUMNS, use_copy=True):
+    """
+    Load df[columns] into table, with COPY if possible, else batched INSERTs.
+    Runs inside the caller's transaction (nothing is committed). Returns the method used.
+    """
+    rows = frame_rows(df, columns)
+    if use_copy:
+        # A failed COPY must not abort the caller's transaction
+        cur.execute("SAVEPOINT bulk_load_copy;")
+        try:
+            copy_rows(cur, table, columns, rows)
+            cur.execute("RELEASE SAVEPOINT bulk_load_copy;")
+            return "copy"
+        except (psycopg2.IntegrityError, psycopg2.DataError):
+            # Bad rows would fail the INSERTs as well
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_load_copy;")
+            raise
+        except psycopg2.Error as e:
+            # e.g. COPY not permitted for this role, or not supported by a connection pooler
+            cur.execute("ROLLBACK TO SAVEPOINT bulk_load_copy;")
+            print(f"COPY not possible ({e.pgcode or type(e).__name__}: {str(e).strip()}). Using batched INSERTs.")
+    insert_rows(cur, table, columns, rows)
+    return "insert"
+
+
+# =======================
+# Swap mode: load a staging table, then exchange it with the live table
+# =======================
+
+
+def split_table(table):
+    schema, _, name = table.rpartition(".")
+    return schema or "public", name
+
+
+def check_swappable(cur, table):
+    """
+    Views and foreign keys keep pointing at a renamed table, so they would follow the old live
+    table out. Refuse to swap tables that have any.
+    """
+    cur.execute("""
+        SELECT (SELECT count(DISTINCT r.ev_class) FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+                WHERE d.refobjid = %(t)s::regclass AND r.ev_class <> %(t)s::regclass),
+               (SELECT count(*) FROM pg_constraint WHERE confrelid = %(t)s::regclass AND contype = 'f');
+    """, {"t": table})
+    views, foreign_keys = cur.fetchone()
+    if views or foreign_keys:
+        raise ValueError(f"{table} is used by {views} view(s) and {foreign_keys} foreign key(s), "
+                         f"which would follow the renamed table. It cannot be swapped; use the replace mode.")
+
+
+def copy_grants(cur, source, target):
+    """Give target the same table privileges as source (CREATE TABLE ... LIKE does not copy them)."""
+    schema, name = split_table(source)
+    cur.execute("""
+        SELECT grantee, privilege_type FROM information_schema.role_table_grants
+        WHERE table_schema = %s AND table_name = %s AND grantee <> current_user;
+    """, (schema, name))
+    for grantee, privilege in cur.fetchall():
+        grantee_sql = sql.SQL("PUBLIC") if grantee == "PUBLIC" else sql.Identifier(grantee)
+        cur.execute(sql.SQL("GRANT {} ON {} TO {};").format(
+            sql.SQL(privilege), table_identifier(target), grantee_sql))
+
+
+def validate_loaded(cur, table, expected_rows):
+    """Check a freshly loaded table: expected row count, every id present and unique."""
+    cur.execute(sql.SQL("SELECT count(*), count(id), count(DISTINCT id) FROM {};").format(table_identifier(table)))
+    rows, ids, distinct_ids = cur.fetchone()
+    problems = []
+    if rows != expected_rows:
+        problems.append(f"{rows} rows loaded, {expected_rows} expected")
+    if ids != rows:
+        problems.append(f"{rows - ids} rows without an id")
+    if distinct_ids != ids:
+        problems.append(f"{ids - distinct_ids} duplicate ids")
+    if problems:
+        raise ValueError(f"{table} failed validation: " + "; ".join(problems))
+
+
+def create_staging(cur, table="public.mahsa_thesauri", staging="public.mahsa_thesauri_staging"):
+    """
+    (Re)create staging as a copy of table's definition (columns, defaults, constraints, indexes)
+    and privileges. Runs in the caller's transaction.
+    """
+    check_swappable(cur, table)
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(table_identifier(staging)))
+    cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING ALL);").format(
+        table_identifier(staging), table_identifier(table)))
+    copy_grants(cur, table, staging)
+
+
+def load_staging(conn, df, table="public.mahsa_thesauri", staging="public.mahsa_thesauri_staging",
+                 columns=MAHSA_THESAURI_COLUMNS):
+    """
+    Create staging like table, bulk load df into it, validate and analyze it, and commit.
+    The live table is not touched. Returns the load method used.
+    """
+    with conn.cursor() as cur:
+        try:
+            create_staging(cur, table, staging)
+            method = bulk_load(cur, df, staging, columns)
+            validate_loaded(cur, staging, len(df))
+            cur.execute(sql.SQL("ANALYZE {};").format(table_identifier(staging)))
+        except (psycopg2.Error, ValueError):
+            conn.rollback()
+            raise
+    conn.commit()
+    return method
+
+
+def _rename_indexes(cur, table, old_prefix, new_prefix):
+    # Keep index names in step with the table names (e.g. mahsa_thesauri_pkey)
+    cur.execute("""
+        SELECT n.nspname, c.relname FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE i.indrelid = %s::regclass;
+    """, (table,))
+    for schema, index in cur.fetchall():
+        if index.startswith(old_prefix):
+            cur.execute(sql.SQL("ALTER INDEX {} RENAME TO {};").format(
+                sql.Identifier(schema, index), sql.Identifier(new_prefix + index[len(old_prefix):])))
+
+
+def lock_table(cur, table, lock_timeout="5s"):
+    """
+    Take table's exclusive lock for the rest of the transaction. Gives up after lock_timeout
+    instead of queueing behind long-running queries (and blocking every reader behind it).
+    """
+    cur.execute("SET LOCAL lock_timeout = %s;", (lock_timeout,))
+    cur.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE;").format(table_identifier(table)))
+
+
+def swap_in(cur, table, staging, old_name):
+    """
+    Rename table to old_name and staging to table, with their indexes. Runs in the caller's
+    transaction, which should hold table's lock (lock_table), so readers only wait for the renames.
+    """
+    _, table_name = split_table(table)
+    _, staging_name = split_table(staging)
+    _rename_indexes(cur, table, table_name, old_name)
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(table_identifier(table), sql.Identifier(old_name)))
+    _rename_indexes(cur, staging, staging_name, table_name)
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(table_identifier(staging), sql.Identifier(table_name)))
+    schema, _ = split_table(table)
+    move_owned_sequences(cur, f"{schema}.{old_name}", table)
+
+
+def move_owned_sequences(cur, source, target):
+    """
+    Make target's columns own the sequences that source's columns own and that target's column
+    defaults still use (a serial id copied by create_staging keeps the old table's sequence).
+    Otherwise dropping source, e.g. an old snapshot, would fail or drop target's id default with it.
+    """
+    cur.execute("""
+        SELECT n.nspname, s.relname, a.attname
+        FROM pg_depend own
+        JOIN pg_class s ON s.oid = own.objid AND s.relkind = 'S'
+        JOIN pg_namespace n ON n.oid = s.relnamespace
+        JOIN pg_attribute a ON a.attrelid = own.refobjid AND a.attnum = own.refobjsubid
+        WHERE own.classid = 'pg_class'::regclass AND own.refobjid = to_regclass(%(source)s)
+          AND own.deptype = 'a'
+          AND EXISTS (SELECT 1 FROM pg_depend used
+                      JOIN pg_attrdef ad ON ad.oid = used.objid
+                      JOIN pg_attribute t ON t.attrelid = ad.adrelid AND t.attnum = ad.adnum
+                      WHERE used.classid = 'pg_attrdef'::regclass AND used.refobjid = s.oid
+                        AND ad.adrelid = to_regclass(%(target)s) AND t.attname = a.attname);
+    """, {"source": source, "target": target})
+    for seq_schema, seq_name, column in cur.fetchall():
+        cur.execute(sql.SQL("ALTER SEQUENCE {}.{} OWNED BY {}.{};").format(
+            sql.Identifier(seq_schema), sql.Identifier(seq_name), table_identifier(target), sql.Identifier(column)))
+
+
+# =======================
+# Delta mode: apply only the inserted, updated and deleted concepts
+# =======================
+
+# Temporary table of the rows changed by delta_upsert (see there)
+REPLACED_TABLE = "mahsa_thesauri_replaced"
+
+
+def _moved_ids(cur, live, new):
+    # ids that belong to another concept in the new rows than in the live table
+    cur.execute(sql.SQL("""
+        SELECT count(*) FROM {live} l JOIN {new} n ON n.id = l.id
+        WHERE (l.list_name, l.concept_key) IS DISTINCT FROM (n.list_name, n.concept_key);
+    """).format(live=live, new=new))
+    return cur.fetchone()[0]
+
+
+def delta_upsert(conn, df, table="public.mahsa_thesauri", key=("list_name", "concept_key"),
+                 columns=MAHSA_THESAURI_COLUMNS, before_write=None, after_write=None):
+    """
+    Make table hold the rows of df by changing only what differs, in one transaction:
+    df is loaded into a temporary table, then rows whose key is gone are deleted, rows whose
+    other columns differ are updated and rows whose key is new are inserted.
+    before_write(cur) and after_write(cur) run in the same transaction around the changes. If
+    nothing changed, the transaction is rolled back, including what they did. For after_write, the
+    temporary table REPLACED_TABLE holds the old rows that were updated or deleted and the rows
+    inserted, with the change ("updated", "deleted" or "inserted") in its first column.
+
+    Script 2 numbers the concepts 1..N on every run, so one concept added or removed shifts the
+    id of every later concept. With the default key (list_name, concept_key), the CDB rows keep
+    their ids: id is not compared or updated, and new rows get the ids after the highest one in
+    table. key=("id",) is refused when an id now belongs to another concept than in table.
+    Returns ({list_name: {"inserted": n, "updated": n, "deleted": n}}, load method).
+    """
+    key = list(key)
+    # The ids of df only count when they are the key
+    values = [c for c in columns if c not in key and (c != "id" or "id" in key)]
+    live = table_identifier(table)
+    new = sql.Identifier("mahsa_thesauri_delta")
+    replaced = sql.Identifier(REPLACED_TABLE)
+    match = sql.SQL(" AND ").join(sql.SQL("n.{c} = l.{c}").format(c=sql.Identifier(c)) for c in key)
+
+    changes = {}
+
+    def count(list_name, change):
+        per_list = changes.setdefault(list_name, {"inserted": 0, "updated": 0, "deleted": 0})
+        per_list[change] += 1
+
+    with conn.cursor() as cur:
+        try:
+            cur.execute(sql.SQL("CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP;").format(new, live))
+            method = bulk_load(cur, df, "mahsa_thesauri_delta", columns)
+
+            # Each key may appear once in the new rows (it must match one live row), and NULL keys match nothing
+            cur.execute(sql.SQL("""
+                SELECT count(*) FILTER (WHERE n > 1), count(*) FILTER (WHERE has_null)
+                FROM (SELECT count(*) AS n, bool_or({null_key}) AS has_null FROM {new} GROUP BY {k}) g;
+            """).format(
+                null_key=sql.SQL(" OR ").join(sql.SQL("{} IS NULL").format(sql.Identifier(c)) for c in key),
+                new=new, k=sql.SQL(", ").join(map(sql.Identifier, key))))
+            duplicate_keys, null_keys = cur.fetchone()
+            if duplicate_keys or null_keys:
+                raise ValueError(f"New concepts have {duplicate_keys} duplicate and {null_keys} missing "
+                                 f"({', '.join(key)}) keys.")
+
+            # No other load may add rows (and ids) until this one commits; readers are not blocked
+            cur.execute(sql.SQL("LOCK TABLE {} IN SHARE ROW EXCLUSIVE MODE;").format(live))
+            if key == ["id"]:
+                moved = _moved_ids(cur, live, new)
+                if moved:
+                    raise ValueError(f"{moved} ids belong to other concepts than in {table} (script 2 numbers the "
+                                     f"concepts on every run), so matching by id would update the wrong rows. "
+                                     f"Match by list_name + concept_key instead (THESAURI_CDB_DELTA_KEY=concept).")
+
+            if before_write:
+                before_write(cur)
+
+            # Every row changed below, as it was before (and the inserted rows), for after_write
+            cur.execute(sql.SQL("CREATE TEMP TABLE {} (change text, LIKE {}) ON COMMIT DROP;").format(replaced, live))
+
+            # Rows whose key is gone
+            cur.execute(sql.SQL("""
+                WITH gone AS (DELETE FROM {live} l WHERE NOT EXISTS (SELECT 1 FROM {new} n WHERE {match}) RETURNING l.*)
+                INSERT INTO {replaced} SELECT 'deleted', gone.* FROM gone
+                RETURNING list_name;
+            """).format(live=live, new=new, match=match, replaced=replaced))
+            for (list_name,) in cur.fetchall():
+                count(list_name, "deleted")
+
+            # Rows whose key is still there, only when a value differs
+            differs = sql.SQL("{match} AND ({old}) IS DISTINCT FROM ({changed})").format(
+                match=match,
+                old=sql.SQL(", ").join(sql.SQL("l.{}").format(sql.Identifier(c)) for c in values),
+                changed=sql.SQL(", ").join(sql.SQL("n.{}").format(sql.Identifier(c)) for c in values))
+            cur.execute(sql.SQL("INSERT INTO {replaced} SELECT 'updated', l.* FROM {live} l, {new} n WHERE {differs};")
+                        .format(replaced=replaced, live=live, new=new, differs=differs))
+            cur.execute(sql.SQL("""
+                UPDATE {live} l SET {assign} FROM {new} n WHERE {differs}
+                RETURNING l.list_name;
+            """).format(
+                live=live, new=new, differs=differs,
+                assign=sql.SQL(", ").join(sql.SQL("{c} = n.{c}").format(c=sql.Identifier(c)) for c in values),
+            ))
+            for (list_name,) in cur.fetchall():
+                count(list_name, "updated")
+
+            # Rows whose key is new. Unless id is the key, they are numbered after the highest live id,
+            # in the order of their new ids.
+            inserted = [sql.SQL("n.{}").format(sql.Identifier(c)) for c in columns]
+            if "id" in columns and "id" not in key:
+                inserted[columns.index("id")] = sql.SQL(
+                    "(SELECT coalesce(max(id), 0) FROM {live}) + row_number() OVER (ORDER BY n.id)").format(live=live)
+            cur.execute(sql.SQL("""
+                WITH added AS (
+                    INSERT INTO {live} ({cols})
+                    SELECT {inserted} FROM {new} n WHERE NOT EXISTS (SELECT 1 FROM {live} l WHERE {match})
+                    RETURNING *)
+                INSERT INTO {replaced} SELECT 'inserted', added.* FROM added
+                RETURNING list_name;
+            """).format(live=live, new=new, match=match, cols=sql.SQL(", ").join(map(sql.Identifier, columns)),
+                        inserted=sql.SQL(", ").join(inserted), replaced=replaced))
+            for (list_name,) in cur.fetchall():
+                count(list_name, "inserted")
+
+            if changes and after_write:
+                after_write(cur)
+        except (psycopg2.Error, ValueError):
+            conn.rollback()
+            raise
+    if changes:
+        conn.commit()
+    else:
+        conn.rollback()
+    return changes, method
@@ -0,0 +1,135 @@
+# =======================
+# Shared access to the CDB (PostgreSQL): settings, pooled connections, timeouts, timing
+# =======================
+#
+# Connection details come from the .env file (DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT).
+# Optional settings (environment or .env):
+#   THESAURI_DB_STATEMENT_TIMEOUT  longest a statement may run (default 10min)
+#   THESAURI_DB_LOCK_TIMEOUT       longest a statement waits for a lock (default 30s)
+#   THESAURI_DB_CONNECT_RETRIES    connection attempts before giving up (default 3)
+#   THESAURI_DB_LOG=0              do not print the timing of each statement
+
+import atexit
+import os
+import time
+
+import psycopg2
+from dotenv import load_dotenv, find_dotenv
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import SimpleConnectionPool
+
+REQUIRED_ENV_VARS = ["DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT"]
+POOL_MAX_CONNECTIONS = 4
+
+_pool = None
+
+
+def _setting(name, default):
+    value = os.getenv(name, "").strip()
+    return value or default
+
+
+def connection_settings():
+    """Keyword arguments for psycopg2.connect, from the .env file. Fails if a setting is missing."""
+    load_dotenv(find_dotenv())
+    missing = [k for k in REQUIRED_ENV_VARS if not os.getenv(k)]
+    if missing:
+        raise RuntimeError(f"Missing required env vars: {', '.join(missing)}. "
+                           f"Did you create your .env or set your Run/Debug working directory?")
+    statement_timeout = _setting("THESAURI_DB_STATEMENT_TIMEOUT", "10min")
+    lock_timeout = _setting("THESAURI_DB_LOCK_TIMEOUT", "30s")
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+        "application_name": "thesauri_update",
+        # Fail instead of hanging when Arches holds a lock or a statement runs away
+        "options": f"-c statement_timeout={statement_timeout} -c lock_timeout={lock_timeout}",
+        "cursor_factory": TimedCursor,
+    }
+
+
+def _describe(cur, query):
+    # First line of the statement, for the log
+    if not isinstance(query, (str, bytes)):
+        query = query.as_string(cur)
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    text = " ".join(query.split())
+    return text if len(text) <= 100 else text[:97] + "..."
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that prints the duration and row count of each statement it runs."""
+
+    def _timed(self, run, query):
+        if _setting("THESAURI_DB_LOG", "1").lower() in ("0", "no", "false"):
+            return run()
+        started = time.perf_counter()
+        try:
+            result = run()
+        except Exception:
+            print(f"[CDB] failed after {(time.perf_counter() - started) * 1000:.1f} ms: {_describe(self, query)}")
+            raise
+        rows = f"{self.rowcount} rows" if self.rowcount >= 0 else "-"
+        print(f"[CDB] {(time.perf_counter() - started) * 1000:8.1f} ms  {rows:>10}  {_describe(self, query)}")
+        return result
+
+    def execute(self, query, vars=None):
+        return self._timed(lambda: super(TimedCursor, self).execute(query, vars), query)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._timed(lambda: super(TimedCursor, self).copy_expert(sql, file, size), sql)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = SimpleConnectionPool(0, POOL_MAX_CONNECTIONS, **connection_settings())
+    return _pool
+
+
+def get_connection():
+    """
+    Connection from the pool, which the scripts run by the wrapper share. Connecting is retried
+    with exponential backoff (1 s, 2 s, ...) on connection errors. Return it with release().
+    """
+    retries = int(_setting("THESAURI_DB_CONNECT_RETRIES", "3"))
+    for attempt in range(1, retries + 1):
+        try:
+            conn = _get_pool().getconn()
+            if conn.closed:
+                # Dropped by the server since it was last used
+                _pool.putconn(conn, close=True)
+                continue
+            return conn
+        except psycopg2.OperationalError as e:
+            if attempt == retries:
+                raise
+            wait = 2 ** (attempt - 1)
+            print(f"Could not connect to the CDB ({str(e).strip()}). Retrying in {wait} s...")
+            time.sleep(wait)
+    return _get_pool().getconn()
+
+
+def release(conn):
+    """Give a connection back to the pool, rolling back anything left uncommitted."""
+    if _pool is None or _pool.closed:
+        conn.close()
+        return
+    if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+    _pool.putconn(conn, close=bool(conn.closed))
+
+
+def close_pool():
+    """Close every pooled connection."""
+    global _pool
+    if _pool is not None and not _pool.closed:
+        _pool.closeall()
+    _pool = None
+
+
+atexit.register(close_pool)
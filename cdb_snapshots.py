@@ -0,0 +1,260 @@
+# =======================
+# Versioned snapshots of mahsa_thesauri
+# =======================
+#
+# Every load of mahsa_thesauri is recorded in mahsa_thesauri_versions, with the CSV it came from.
+# When a version is replaced, its contents are kept so it can be swapped back in with
+# thesauri_cdb_restore.py:
+#   - swap mode renames the replaced table to mahsa_thesauri_v<version>, so the snapshot costs no copy;
+#   - replace mode copies its rows to mahsa_thesauri_v<version> with CREATE TABLE ... AS (no indexes);
+#   - delta mode only keeps the rows it updated or deleted (and the ids it inserted) in
+#     mahsa_thesauri_changes, by version. The version is rebuilt from the next version's contents.
+# The last N snapshots are kept. mahsa_thesauri_backup is no longer written.
+
+import psycopg2
+from psycopg2 import sql
+
+from cdb_load import (MAHSA_THESAURI_COLUMNS, REPLACED_TABLE, bulk_load, create_staging, lock_table, move_owned_sequences,
+                      split_table, swap_in, table_identifier, validate_loaded)
+
+DEFAULT_KEEP = 5
+
+
+def _versions(table):
+    return table_identifier(table + "_versions")
+
+
+def snapshot_table_name(table, version):
+    """Name (without schema) of the snapshot table of a version."""
+    return f"{split_table(table)[1]}_v{version}"
+
+
+def changes_table_name(table):
+    """Name (without schema) of the table with the rows replaced by delta loads, by version."""
+    return f"{split_table(table)[1]}_changes"
+
+
+def ensure_versions_table(cur, table="public.mahsa_thesauri"):
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {} (
+            version serial PRIMARY KEY,
+            source_csv text,
+            loaded_at timestamptz,
+            row_count integer,
+            restored_from integer,
+            snapshot_table text,
+            snapshot_at timestamptz
+        );
+    """).format(_versions(table)))
+
+
+def live_version(cur, table="public.mahsa_thesauri"):
+    """
+    Version number of the current contents of table. Contents loaded before versions were kept
+    are recorded as a version without a source CSV.
+    """
+    ensure_versions_table(cur, table)
+    cur.execute(sql.SQL("SELECT max(version) FROM {} WHERE snapshot_table IS NULL;").format(_versions(table)))
+    version = cur.fetchone()[0]
+    if version is None:
+        cur.execute(sql.SQL("INSERT INTO {} (row_count) SELECT count(*) FROM {} RETURNING version;").format(
+            _versions(table), table_identifier(table)))
+        version = cur.fetchone()[0]
+    return version
+
+
+def _mark_snapshot(cur, table, version, snapshot):
+    cur.execute(sql.SQL("UPDATE {} SET snapshot_table = %s, snapshot_at = now() WHERE version = %s;").format(
+        _versions(table)), (snapshot, version))
+
+
+def snapshot_copy(cur, table="public.mahsa_thesauri"):
+    """Copy the current contents of table to its version's snapshot table. Returns the snapshot name."""
+    version = live_version(cur, table)
+    snapshot = snapshot_table_name(table, version)
+    schema, _ = split_table(table)
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(schema, snapshot)))
+    cur.execute(sql.SQL("CREATE TABLE {} AS SELECT * FROM {};").format(
+        sql.Identifier(schema, snapshot), table_identifier(table)))
+    _mark_snapshot(cur, table, version, snapshot)
+    return snapshot
+
+
+def snapshot_changes(cur, table="public.mahsa_thesauri", replaced=REPLACED_TABLE):
+    """
+    After a delta load (cdb_load.delta_upsert), keep the rows it changed as the snapshot of the
+    version they belonged to: the old rows it updated or deleted and the rows it inserted. Returns
+    the name of the changes table.
+    """
+    version = live_version(cur, table)
+    schema, _ = split_table(table)
+    changes = changes_table_name(table)
+    cur.execute(sql.SQL("""
+        CREATE TABLE IF NOT EXISTS {changes} (version integer NOT NULL, change text NOT NULL, LIKE {table});
+        CREATE INDEX IF NOT EXISTS {index} ON {changes} (version);
+    """).format(changes=sql.Identifier(schema, changes), table=table_identifier(table),
+                index=sql.Identifier(changes + "_version_idx")))
+    cur.execute(sql.SQL("INSERT INTO {} SELECT %s, r.* FROM {} r;").format(
+        sql.Identifier(schema, changes), sql.Identifier(replaced)), (version,))
+    _mark_snapshot(cur, table, version, changes)
+    return changes
+
+
+def snapshot_swap(cur, table="public.mahsa_thesauri", staging="public.mahsa_thesauri_staging"):
+    """
+    Rename table to its version's snapshot table and staging to table, under table's lock.
+    Returns the snapshot name.
+    """
+    lock_table(cur, table)
+    version = live_version(cur, table)
+    snapshot = snapshot_table_name(table, version)
+    schema, _ = split_table(table)
+    cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(schema, snapshot)))
+    swap_in(cur, table, staging, snapshot)
+    _mark_snapshot(cur, table, version, snapshot)
+    return snapshot
+
+
+def record_load(cur, table, source_csv, row_count, restored_from=None):
+    """Record the new contents of table as a new version. Returns its number."""
+    ensure_versions_table(cur, table)
+    cur.execute(sql.SQL("""
+        INSERT INTO {} (source_csv, loaded_at, row_count, restored_from) VALUES (%s, now(), %s, %s)
+        RETURNING version;
+    """).format(_versions(table)), (source_csv, row_count, restored_from))
+    return cur.fetchone()[0]
+
+
+def prune_snapshots(cur, table="public.mahsa_thesauri", keep=DEFAULT_KEEP):
+    """Drop all but the newest keep snapshots (tables, or rows of the changes table). Returns the versions dropped."""
+    cur.execute(sql.SQL("""
+        SELECT version, snapshot_table FROM {} WHERE snapshot_table IS NOT NULL
+        ORDER BY version DESC OFFSET %s;
+    """).format(_versions(table)), (keep,))
+    dropped = cur.fetchall()
+    schema, _ = split_table(table)
+    changes = changes_table_name(table)
+    for version, snapshot in dropped:
+        if snapshot == changes:
+            cur.execute(sql.SQL("DELETE FROM {} WHERE version = %s;").format(sql.Identifier(schema, changes)),
+                        (version,))
+            continue
+        # Snapshots swapped out before the sequences moved with the swap may still own table's id sequence
+        move_owned_sequences(cur, f"{schema}.{snapshot}", table)
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(schema, snapshot)))
+    if dropped:
+        cur.execute(sql.SQL("DELETE FROM {} WHERE version = ANY(%s);").format(_versions(table)),
+                    ([v for v, _ in dropped],))
+    return [v for v, _ in dropped]
+
+
+def swap_new_version(conn, source_csv, row_count, table="public.mahsa_thesauri",
+                     staging="public.mahsa_thesauri_staging", keep=DEFAULT_KEEP, restored_from=None):
+    """
+    In one short transaction: keep the current table as a snapshot, swap the loaded staging
+    table in, record it as a new version and prune old snapshots. Returns (version, snapshot name).
+    """
+    with conn.cursor() as cur:
+        try:
+            snapshot = snapshot_swap(cur, table, staging)
+            version = record_load(cur, table, source_csv, row_count, restored_from)
+            prune_snapshots(cur, table, keep)
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+    conn.commit()
+    return version, snapshot
+
+
+def replace_new_version(conn, df, source_csv, table="public.mahsa_thesauri", keep=DEFAULT_KEEP,
+                        columns=MAHSA_THESAURI_COLUMNS):
+    """
+    In one transaction: copy table to its version's snapshot, delete its rows, bulk load df,
+    record it as a new version and prune old snapshots. If any step fails, table keeps its
+    contents. Returns (version, snapshot name, load method).
+    """
+    with conn.cursor() as cur:
+        try:
+            snapshot = snapshot_copy(cur, table)
+            cur.execute(sql.SQL("DELETE FROM {};").format(table_identifier(table)))
+            method = bulk_load(cur, df, table, columns)
+            version = record_load(cur, table, source_csv, len(df))
+            prune_snapshots(cur, table, keep)
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+    conn.commit()
+    return version, snapshot, method
+
+
+def list_versions(conn, table="public.mahsa_thesauri"):
+    """All recorded versions, newest first, as dicts."""
+    with conn.cursor() as cur:
+        ensure_versions_table(cur, table)
+        cur.execute(sql.SQL("""
+            SELECT version, source_csv, loaded_at, row_count, restored_from, snapshot_table, snapshot_at
+            FROM {} ORDER BY version DESC;
+        """).format(_versions(table)))
+        names = [d[0] for d in cur.description]
+        rows = [dict(zip(names, row)) for row in cur.fetchall()]
+    conn.commit()
+    return rows
+
+
+def _restore_source(cur, table, version):
+    # The table the rows of version are rebuilt from, and the delta versions to undo on top of it,
+    # newest first: version's own snapshot table, or the first one after it (or table itself)
+    changes = changes_table_name(table)
+    cur.execute(sql.SQL("SELECT version, snapshot_table FROM {} WHERE version >= %s ORDER BY version;").format(
+        _versions(table)), (version,))
+    found = cur.fetchall()
+    if not found or found[0][0] != version:
+        raise ValueError(f"No version {version} of {table}.")
+    if found[0][1] is None:
+        raise ValueError(f"Version {version} is the current contents of {table}.")
+    schema, _ = split_table(table)
+    undo = []
+    for later, snapshot in found:
+        if snapshot != changes:
+            return (table_identifier(table) if snapshot is None else sql.Identifier(schema, snapshot)), undo[::-1]
+        undo.append(later)
+    raise ValueError(f"The versions after {version} of {table} cannot be rebuilt.")
+
+
+def restore_version(conn, version, table="public.mahsa_thesauri", staging="public.mahsa_thesauri_staging",
+                    keep=DEFAULT_KEEP, columns=MAHSA_THESAURI_COLUMNS):
+    """
+    Put the rows of a snapshot back into table: they are copied into a staging table (the
+    snapshot itself is kept), which is then swapped in like a new load. The rows of a delta
+    version are the next version's rows with the changes of the delta load undone. The replaced
+    contents become a snapshot too. Returns the new version number.
+    """
+    schema, _ = split_table(table)
+    changes = sql.Identifier(schema, changes_table_name(table))
+    cols = sql.SQL(", ").join(map(sql.Identifier, columns))
+    with conn.cursor() as cur:
+        try:
+            ensure_versions_table(cur, table)
+            cur.execute(sql.SQL("SELECT source_csv, row_count FROM {} WHERE version = %s;").format(
+                _versions(table)), (version,))
+            source_csv, row_count = cur.fetchone() or (None, None)
+            source, undo = _restore_source(cur, table, version)
+
+            create_staging(cur, table, staging)
+            cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {};").format(
+                table_identifier(staging), cols, cols, source))
+            for delta_version in undo:
+                # Drop the rows the delta load inserted or updated, and put back the ones it replaced
+                cur.execute(sql.SQL("DELETE FROM {} WHERE id IN (SELECT id FROM {} WHERE version = %s);").format(
+                    table_identifier(staging), changes), (delta_version,))
+                cur.execute(sql.SQL("""
+                    INSERT INTO {} ({}) SELECT {} FROM {} WHERE version = %s AND change <> 'inserted';
+                """).format(table_identifier(staging), cols, cols, changes), (delta_version,))
+            validate_loaded(cur, staging, row_count)
+            cur.execute(sql.SQL("ANALYZE {};").format(table_identifier(staging)))
+        except (psycopg2.Error, ValueError):
+            conn.rollback()
+            raise
+    conn.commit()
+    new_version, _ = swap_new_version(conn, source_csv, row_count, table, staging, keep, restored_from=version)
+    return new_version
@@ -0,0 +1,216 @@
+# =======================
+# Concept comparison between the thesauri and the Arches export, inside matching list_names
+# =======================
+
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import fuzzy_match
+from fuzzy_match import CloseMatchIndex
+from stage_cache import file_digest
+
+# Columns of the exact matches frame (concept_exact_df_def in script 2)
+EXACT_COLUMNS = ['list_name', 'thesauri_concept_name', 'arches_concept_name', 'definition', 'list_order',
+                 'concept_value', 'sortorder', 'bulk_import', 'ODK_list_name', 'ODK_multi', 'odk_value']
+
+# Columns of the non-matches frame (concept_nm_df in script 2)
+NON_MATCH_COLUMNS = ['list_name', 'thesauri_concept_name', 'arches_concept_name', 'close_match']
+
+
+def _concept_keys(df, concept_col):
+    return pd.MultiIndex.from_arrays([df['list_name'], df[concept_col]])
+
+
+def exact_concept_matches(thesauri_df, arches_df, list_names):
+    """
+    Match thesauri concept_value to Arches concept_key inside each of list_names with one keyed merge.
+
+    Returns (exact_df, thesauri_unmatched, arches_unmatched):
+      - exact_df has EXACT_COLUMNS, one row per matching concept, taken from the first thesauri
+        and the first Arches row of that concept, ordered by list_names then thesauri row order
+      - thesauri_unmatched / arches_unmatched map each list_name to the set of its concepts
+        that have no exact match (lists without leftovers are left out)
+    """
+    list_position = {name: i for i, name in enumerate(list_names)}
+
+    # First occurrence of every concept in the matched lists
+    thesauri_first = (
+        thesauri_df[thesauri_df['list_name'].isin(list_position)]
+        .dropna(subset=['concept_value'])
+        .drop_duplicates(subset=['list_name', 'concept_value'])
+    )
+    arches_first = (
+        arches_df[arches_df['list_name'].isin(list_position)]
+        .dropna(subset=['concept_key'])
+        .drop_duplicates(subset=['list_name', 'concept_key'])
+    )
+
+    merged = pd.merge(
+        thesauri_first.rename(columns={'concept_value': 'thesauri_concept_name'})
+                      .drop(columns=['concept_key']),
+        arches_first[['list_name', 'concept_key', 'concept_value', 'sortorder']]
+                    .rename(columns={'concept_key': 'arches_concept_name'}),
+        left_on=['list_name', 'thesauri_concept_name'],
+        right_on=['list_name', 'arches_concept_name'],
+        how='inner'
+    )
+    # (as float: a categorical list_name maps to a categorical, which would sort by its codes)
+    positions = np.asarray(merged['list_name'].map(list_position), dtype=float)
+    merged = merged.iloc[positions.argsort(kind='stable')]
+    exact_df = merged.reindex(columns=EXACT_COLUMNS).reset_index(drop=True)
+
+    # Only what is left over goes on to the close-match stage
+    exact_keys = _concept_keys(exact_df, 'thesauri_concept_name')
+    thesauri_rest = thesauri_first[~_concept_keys(thesauri_first, 'concept_value').isin(exact_keys)]
+    arches_rest = arches_first[~_concept_keys(arches_first, 'concept_key').isin(exact_keys)]
+
+    thesauri_unmatched = thesauri_rest.groupby('list_name', observed=True)['concept_value'].agg(set).to_dict()
+    arches_unmatched = arches_rest.groupby('list_name', observed=True)['concept_key'].agg(set).to_dict()
+
+    return exact_df, thesauri_unmatched, arches_unmatched
+
+
+def close_concept_matches(list_name, thesauri_unmatched, arches_unmatched, cutoff=0.8):
+    """
+    Pair up the unmatched concepts of one list_name by close match and return the
+    non-match rows (dicts with NON_MATCH_COLUMNS) for that list.
+
+    Concepts are visited in sorted order, so the pairing does not depend on set order
+    (which changes from one process to another).
+    """
+    thesauri_unmatched = set(thesauri_unmatched)
+    arches_unmatched = set(arches_unmatched)
+    concept_non_matches = []
+
+    # Try to find close matches for thesauri_unmatched concepts
+    # (the index gives the same results as difflib.get_close_matches)
+    arches_index = CloseMatchIndex(arches_unmatched, cutoff=cutoff)
+    for concept in sorted(thesauri_unmatched):
+        close = arches_index.best_match(concept)
+        if close is not None:
+            concept_non_matches.append({
+                'list_name': list_name,
+                'thesauri_concept_name': concept,
+                'arches_concept_name': close,
+                'close_match': 'yes'
+            })
+            arches_unmatched.discard(close)
+            arches_index.discard(close)
+        else:
+            concept_non_matches.append({
+                'list_name': list_name,
+                'thesauri_concept_name': concept,
+                'arches_concept_name': pd.NA,
+                'close_match': 'no'
+            })
+
+    # Handle arches concepts still unmatched
+    thesauri_index = CloseMatchIndex(thesauri_unmatched, cutoff=cutoff)
+    for concept in sorted(arches_unmatched):
+        close = thesauri_index.best_match(concept)
+        if close is not None:
+            concept_non_matches.append({
+                'list_name': list_name,
+                'thesauri_concept_name': close,
+                'arches_concept_name': concept,
+                'close_match': 'yes'
+            })
+            thesauri_unmatched.discard(close)
+            thesauri_index.discard(close)
+        else:
+            concept_non_matches.append({
+                'list_name': list_name,
+                'thesauri_concept_name': pd.NA,
+                'arches_concept_name': concept,
+                'close_match': 'no'
+            })
+
+    return concept_non_matches
+
+
+def _close_concept_matches_job(job, cutoff):
+    list_name, thesauri_unmatched, arches_unmatched = job
+    return close_concept_matches(list_name, thesauri_unmatched, arches_unmatched, cutoff=cutoff)
+
+
+def close_matches_by_list(jobs, cutoff=0.8, workers=1):
+    """
+    Run close_concept_matches for every (list_name, thesauri_unmatched, arches_unmatched) job
+    and return all non-match rows, in job order.
+
+    With workers > 1 the jobs run in a ProcessPoolExecutor; results are still collected in
+    job order, so the output is identical to the serial run.
+    """
+    jobs = list(jobs)
+    if workers <= 1 or len(jobs) <= 1:
+        results = [_close_concept_matches_job(job, cutoff) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            results = list(executor.map(_close_concept_matches_job, jobs, [cutoff] * len(jobs), chunksize=chunksize))
+
+    return [row for rows in results for row in rows]
+
+
+def _matching_code_digest():
+    # Results stored by an older version of the matching code must not be reused
+    return file_digest(__file__) + file_digest(fuzzy_match.__file__)
+
+
+def list_digest(list_name, thesauri_unmatched, arches_unmatched, cutoff, code_digest=None):
+    """Digest of everything the close matches of one list_name depend on."""
+    payload = json.dumps([list_name, sorted(thesauri_unmatched), sorted(arches_unmatched), cutoff,
+                          code_digest or _matching_code_digest()])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def incremental_close_matches(jobs, previous_state=None, cutoff=0.8, workers=1):
+    """
+    Same result as close_matches_by_list, but lists whose unmatched concept sets are unchanged
+    since the previous run take their rows from previous_state instead of being compared again.
+
+    previous_state is the state frame returned by the previous run (NON_MATCH_COLUMNS plus
+    list_digest) or None. Returns (rows, state, reused_count).
+    """
+    code_digest = _matching_code_digest()
+    jobs = list(jobs)
+    digests = [list_digest(*job, cutoff, code_digest) for job in jobs]
+
+    previous_rows = {}
+    if previous_state is not None and len(previous_state):
+        for digest, group in previous_state.groupby('list_digest', sort=False):
+            group = group[NON_MATCH_COLUMNS].astype(object)
+            previous_rows[digest] = group.where(group.notna(), pd.NA).to_dict('records')
+
+    # Lists with nothing left to match have no rows and nothing to compare
+    todo = [job for job, digest in zip(jobs, digests) if digest not in previous_rows and (job[1] or job[2])]
+    computed = iter(_split_by_list(close_matches_by_list(todo, cutoff=cutoff, workers=workers), todo))
+
+    rows, state_parts, reused = [], [], 0
+    for job, digest in zip(jobs, digests):
+        if digest in previous_rows:
+            list_rows = previous_rows[digest]
+            reused += 1
+        elif job[1] or job[2]:
+            list_rows = next(computed)
+        else:
+            list_rows = []
+        rows.extend(list_rows)
+        if list_rows:
+            state_parts.append(pd.DataFrame(list_rows, columns=NON_MATCH_COLUMNS).assign(list_digest=digest))
+
+    columns = NON_MATCH_COLUMNS + ['list_digest']
+    state = pd.concat(state_parts, ignore_index=True) if state_parts else pd.DataFrame(columns=columns)
+    return rows, state, reused
+
+
+def _split_by_list(rows, jobs):
+    # close_matches_by_list returns the rows of all jobs in job order; cut them back per job
+    by_list = {}
+    for row in rows:
+        by_list.setdefault(row['list_name'], []).append(row)
+    return [by_list.get(job[0], []) for job in jobs]
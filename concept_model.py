@@ -0,0 +1,67 @@
+# =======================
+# Compact in-memory model of the thesaurus concepts, shared by the scripts
+# =======================
+#
+# The key columns (list_name, ODK_list_name, bulk_import, ODK_multi) repeat a few hundred
+# distinct values over every concept. load_concepts() holds them as categoricals: each distinct
+# value is stored once and the rows hold small integer codes, so the frames take less memory and
+# merges, groupbys and sorts on them compare codes instead of strings. The categories are sorted,
+# so sorting by a key column gives the same order as sorting the strings.
+#
+# List names are normalised (spaces to underscores, lowercase) once per distinct name with
+# normalise_name().
+
+import sys
+
+import pandas as pd
+
+from artifacts import load_artifact, COMPLETE_CONCEPTS_SCHEMA
+
+# Columns held as categoricals
+KEY_COLUMNS = ('list_name', 'ODK_list_name', 'bulk_import', 'ODK_multi')
+
+# Normalised names by raw name, filled as names are met
+_normalised = {}
+
+
+def normalise_name(value):
+    """Replace spaces with underscores and lowercase (non-strings become None). Each distinct name is done once."""
+    if not isinstance(value, str):
+        return None
+    name = _normalised.get(value)
+    if name is None:
+        # Interned, so every row of a list shares one string object
+        name = _normalised[value] = sys.intern(value.replace(' ', '_').lower())
+    return name
+
+
+def compact(df, columns=KEY_COLUMNS):
+    """Return a copy of df with the columns it has (of columns) as categoricals with sorted categories."""
+    df = df.copy()
+    for col in columns:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def share_categories(frames, column='list_name'):
+    """
+    Give column the same (sorted) categories in all frames, in place, so merges and isin between
+    them compare codes. Frames whose column is not categorical yet are converted.
+    """
+    categories = None
+    for df in frames:
+        found = df[column].astype('category').cat.categories
+        categories = found if categories is None else categories.union(found)
+    for df in frames:
+        df[column] = pd.Categorical(df[column], categories=categories)
+
+
+def load_concepts(path, schema=COMPLETE_CONCEPTS_SCHEMA):
+    """Read a concepts artifact (see artifacts.load_artifact) with its key columns compacted."""
+    return compact(load_artifact(path, schema))
+
+
+def duplicated_keys(df, concept_col='concept_key'):
+    """Boolean array, True for every row whose (list_name, concept_key) appears more than once."""
+    return pd.MultiIndex.from_arrays([df['list_name'], df[concept_col]]).duplicated(keep=False)
@@ -0,0 +1,116 @@
+# =======================
+# Integrity checks of the complete concepts, run before the CDB load and the ODK form build
+# =======================
+#
+# validate_concepts() runs every check over the whole frame with column operations (no loop over
+# the concepts) and returns the checks that failed. check_concepts() prints them and stops the
+# script with exit code 1, so script 5 never empties mahsa_thesauri and script 6 never writes a
+# form from concepts that would break them.
+#
+# Checks:
+#   - duplicate (list_name, concept_key)
+#   - missing or duplicate id
+#   - ODK_list_name values with no choices list (no concept of that list has an odk_value, and it
+#     is not an ODK Only list)
+#   - list_order values that are not numbers
+#   - blank definition where an explicit BI Name is set (bulk_import other than the list_name)
+#   - values longer than their CDB column (when the column lengths are given)
+
+import sys
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from concept_model import duplicated_keys
+from odk_choices import explode_comma_list
+
+# Number of failing rows or values printed per check
+EXAMPLES = 5
+
+
+@dataclass
+class CheckFailure:
+    check: str
+    count: int
+    examples: list = field(default_factory=list)
+
+    def __str__(self):
+        more = f", ... ({self.count - len(self.examples)} more)" if self.count > len(self.examples) else ""
+        return f"{self.check}: {self.count} - " + "; ".join(map(str, self.examples)) + more
+
+
+def _filled(series):
+    # Not missing and not blank
+    return series.astype('string').str.strip().fillna('').ne('').to_numpy(dtype=bool)
+
+
+def _row_examples(df, mask, columns=('list_name', 'concept_key', 'id')):
+    rows = df.loc[mask, [c for c in columns if c in df.columns]].head(EXAMPLES)
+    return [" / ".join("" if pd.isna(v) else str(v) for v in row) for row in rows.itertuples(index=False, name=None)]
+
+
+def _missing_choice_lists(df, choice_lists):
+    # One row per ODK list name of each concept, with whether the concept gives a choice (the
+    # odk_value rows script 6 keeps)
+    odk_value = df['odk_value'].astype('string').str.strip()
+    gives_choice = odk_value.fillna('').ne('') & odk_value.str.lower().ne('nan').fillna(False)
+    names = explode_comma_list(
+        pd.DataFrame({'ODK_list_name': df['ODK_list_name'].to_numpy(), 'choice': gives_choice.to_numpy(dtype=bool)}),
+        'ODK_list_name')
+    names = names[names['ODK_list_name'] != '']
+    has_choices = names.groupby('ODK_list_name')['choice'].any()
+    missing = has_choices[~has_choices & ~has_choices.index.isin(list(choice_lists))]
+    return sorted(missing.index)
+
+
+def validate_concepts(df, choice_lists=(), column_lengths=None):
+    """
+    Run every check over the complete concepts df. choice_lists are list names that get their
+    choices from elsewhere (the ODK Only lists); column_lengths maps columns to their CDB maximum
+    length. Returns the failed checks as CheckFailures (empty if all passed).
+    """
+    failures = []
+
+    def fail_rows(check, mask):
+        mask = pd.Series(mask, index=df.index).fillna(False).astype(bool)
+        if mask.any():
+            failures.append(CheckFailure(check, int(mask.sum()), _row_examples(df, mask)))
+
+    fail_rows("Duplicate (list_name, concept_key)", duplicated_keys(df))
+
+    ids = df['id']
+    fail_rows("Missing id", ids.isna())
+    fail_rows("Duplicate id", ids.notna() & ids.duplicated(keep=False))
+
+    missing_lists = _missing_choice_lists(df, choice_lists)
+    if missing_lists:
+        failures.append(CheckFailure("ODK_list_name without a choices list (no concept has an odk_value)",
+                                     len(missing_lists), missing_lists[:EXAMPLES]))
+
+    list_order = df['list_order'].astype('string').str.strip()
+    fail_rows("Non-numeric list_order",
+              list_order.fillna('').ne('') & pd.to_numeric(list_order, errors='coerce').isna())
+
+    # bulk_import falls back to the list_name, so only an explicit BI Name (another name) needs definitions
+    bulk_import = df['bulk_import'].astype('string')
+    own_bi_name = _filled(bulk_import) & bulk_import.ne(df['list_name'].astype('string')).fillna(True).to_numpy(dtype=bool)
+    fail_rows("Blank definition where a BI Name is set", own_bi_name & ~_filled(df['definition']))
+
+    for col, max_length in (column_lengths or {}).items():
+        if col in df.columns and max_length:
+            fail_rows(f"{col} longer than {max_length} characters (CDB column length)",
+                      df[col].astype('string').str.len().gt(max_length))
+
+    return failures
+
+
+def check_concepts(df, choice_lists=(), column_lengths=None, what="the complete concepts"):
+    """Validate df (see validate_concepts); print the failed checks and exit with code 1 if any failed."""
+    failures = validate_concepts(df, choice_lists, column_lengths)
+    if failures:
+        print(f"❌ {len(failures)} check(s) failed on {what}:")
+        for failure in failures:
+            print(f"   - {failure}")
+        print("Fix the thesauri and run again from script 1. Stopping.")
+        sys.exit(1)
+    print(f"✅ All integrity checks passed on {what} ({len(df)} concepts).")
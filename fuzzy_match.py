@@ -0,0 +1,92 @@
+# =======================
+# Indexed close-match search (drop-in for difflib.get_close_matches with n=1)
+# =======================
+#
+# get_close_matches scores the word against every possibility with SequenceMatcher.
+# CloseMatchIndex keeps the possibilities sorted by length with a per-character count
+# matrix, so for each word it only has to:
+#   1. take the length window that can still reach the cutoff (difflib's real_quick_ratio),
+#   2. drop candidates whose shared character count is too low (difflib's quick_ratio),
+#      computed for the whole window at once with numpy,
+#   3. run SequenceMatcher.ratio() on the few candidates left.
+# Both filters are upper bounds of ratio(), so no match that get_close_matches would
+# return is ever filtered out, and ties are broken the same way (highest ratio, then the
+# greatest string).
+
+from collections import Counter
+from difflib import SequenceMatcher
+
+import numpy as np
+
+DEFAULT_CUTOFF = 0.8
+
+
+class CloseMatchIndex:
+    def __init__(self, choices, cutoff=DEFAULT_CUTOFF):
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError(f"cutoff must be in [0.0, 1.0]: {cutoff!r}")
+        self.cutoff = cutoff
+
+        # Choices are treated as a set and kept sorted by length
+        choices = sorted(set(choices), key=lambda c: (len(c), c))
+        self.choices = choices
+        self.lengths = np.array([len(c) for c in choices], dtype=np.int64)
+        self.active = np.ones(len(choices), dtype=bool)
+        self._position = {c: i for i, c in enumerate(choices)}
+
+        self.alphabet = {}
+        for c in choices:
+            for ch in c:
+                self.alphabet.setdefault(ch, len(self.alphabet))
+        self.counts = np.zeros((len(choices), len(self.alphabet)), dtype=np.int32)
+        for i, c in enumerate(choices):
+            for ch, n in Counter(c).items():
+                self.counts[i, self.alphabet[ch]] = n
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def discard(self, value):
+        """Remove value from the possibilities (no-op if it is not there)."""
+        i = self._position.get(value)
+        if i is not None:
+            self.active[i] = False
+
+    def candidates(self, word):
+        """Active choices that pass difflib's real_quick_ratio and quick_ratio checks for word."""
+        n = len(word)
+        total = self.lengths + n
+
+        # real_quick_ratio: 2 * min(len) / total length. Lengths are sorted, so this is a contiguous window
+        bound = np.divide(2.0 * np.minimum(self.lengths, n), total, out=np.ones(len(total)), where=total > 0)
+        window = np.flatnonzero(bound >= self.cutoff)
+        if len(window) == 0:
+            return []
+        lo, hi = window[0], window[-1] + 1
+
+        # quick_ratio: 2 * shared character count / total length
+        query = np.zeros(len(self.alphabet), dtype=np.int32)
+        for ch, k in Counter(word).items():
+            col = self.alphabet.get(ch)
+            if col is not None:
+                query[col] = k
+        shared = np.minimum(self.counts[lo:hi], query).sum(axis=1)
+        quick = np.divide(2.0 * shared, total[lo:hi], out=np.ones(hi - lo), where=total[lo:hi] > 0)
+
+        keep = (quick >= self.cutoff) & self.active[lo:hi]
+        return [self.choices[lo + i] for i in np.flatnonzero(keep)]
+
+    def best_match(self, word):
+        """
+        Return the same value as get_close_matches(word, choices, n=1, cutoff)[0] over the
+        active choices, or None if nothing reaches the cutoff.
+        """
+        s = SequenceMatcher()
+        s.set_seq2(word)
+        best = None
+        for x in self.candidates(word):
+            s.set_seq1(x)
+            score = s.ratio()
+            if score >= self.cutoff and (best is None or (score, x) > best):
+                best = (score, x)
+        return best[1] if best else None
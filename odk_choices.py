@@ -0,0 +1,135 @@
+# =======================
+# ODK choices sheet: building blocks of script 6
+# =======================
+
+import openpyxl
+import pandas as pd
+
+from xlsx_sheet_writer import replace_sheet
+
+CHOICES_COLUMNS = ["list_name", "name", "label", "media::image", "transect_method_list", "institute_name",
+                   "heritage_resource_classification"]
+
+
+def replace_choices_sheet(form_path, df, output_path=None):
+    """
+    Write a copy of the ODK form at form_path (default: in place) whose 'choices' sheet holds
+    df: its column names as the header row, then one row per choice. The survey, settings and
+    any other sheets are copied through unchanged.
+    """
+    try:
+        replace_sheet(form_path, "choices", df, output_path)
+    except KeyError:
+        raise ValueError("The workbook does not contain a sheet named 'choices'.") from None
+
+
+def odk_only_list_names(path):
+    """Names of the lists of the ODK Only sheet saved by script 1 (the values of its 'ODK List Name' rows)."""
+    wb = openpyxl.load_workbook(path, read_only=True)
+    try:
+        names = set()
+        for row in wb.active.iter_rows(max_col=2, values_only=True):
+            label = str(row[0]).strip().lower() if row and row[0] is not None else ""
+            if label.startswith("odk list name") and len(row) > 1 and row[1] is not None:
+                names.add(str(row[1]).strip())
+        return names
+    finally:
+        wb.close()
+
+
+def explode_comma_list(df, column, into=None):
+    """
+    One row per comma-separated value of df[column], written (stripped) to the column into
+    (default: column itself). Empty parts are dropped, so a value made only of commas and spaces
+    drops its row, while a missing value gives one row with ''. Rows keep df's order and index.
+    """
+    into = into or column
+    exploded = df[column].astype("string").reset_index(drop=True).str.split(",").explode()
+    stripped = exploded.str.strip()
+    missing = exploded.isna()
+    keep = (missing | stripped.ne("")).fillna(False).to_numpy(dtype=bool)
+
+    out = df.iloc[exploded.index.to_numpy()[keep]].copy()
+    out[into] = stripped.where(~missing, "").to_numpy()[keep]
+    return out
+
+
+def _match_key(value):
+    # Missing and empty values never match anything (they are NaN once written to Excel and read back)
+    if value is None or (not isinstance(value, str) and pd.isna(value)) or value == "":
+        return None
+    return value
+
+
+def merge_odk_only(thesauri_choices, odk_choices):
+    """
+    Insert the ODK Only choices into the thesauri choices, one at a time in their order, as the
+    step 4 loop of script 6 did: a row goes right after the last row (so far) with the same
+    heritage_resource_classification, if its list_name is already there; else right after the
+    last row of its list_name; else at the end. Rows inserted earlier count for later rows.
+
+    The positions are worked out on a linked list, with order labels to tell which of two rows
+    comes first, and the frames are then put together in one step. Returns a new frame.
+    """
+    n_thes, n_odk = len(thesauri_choices), len(odk_choices)
+    next_node = list(range(1, n_thes + 1)) + [None] * n_odk
+    if n_thes:
+        next_node[n_thes - 1] = None
+    gap = 1 << 32
+    label = [i * gap for i in range(n_thes)] + [0] * n_odk
+    head = 0 if n_thes else None
+    tail = n_thes - 1 if n_thes else None
+
+    last_of_list, last_of_class = {}, {}
+    for node, (list_name, classification) in enumerate(zip(
+            thesauri_choices["list_name"], thesauri_choices["heritage_resource_classification"])):
+        if _match_key(list_name) is not None:
+            last_of_list[list_name] = node
+        if _match_key(classification) is not None:
+            last_of_class[classification] = node
+
+    def relabel():
+        node, position = head, 0
+        while node is not None:
+            label[node] = position * gap
+            node, position = next_node[node], position + 1
+
+    for i, (list_name, classification) in enumerate(zip(
+            odk_choices["list_name"], odk_choices["heritage_resource_classification"])):
+        node = n_thes + i
+        list_key, class_key = _match_key(list_name), _match_key(classification)
+        after = None
+        if list_key is not None and list_key in last_of_list:
+            after = last_of_class.get(class_key) if class_key is not None else None
+            after = after if after is not None else last_of_list[list_key]
+
+        if after is None or after == tail:
+            # Append at the end
+            if tail is None:
+                head = node
+            else:
+                next_node[tail] = node
+                label[node] = label[tail] + gap
+            tail = node
+            if list_key is not None:
+                last_of_list[list_key] = node
+        else:
+            # Insert between after and its successor
+            successor = next_node[after]
+            if label[successor] - label[after] < 2:
+                relabel()
+            label[node] = (label[after] + label[successor]) // 2
+            next_node[node], next_node[after] = successor, node
+            # The row becomes the last of its list unless that list's last row is further down
+            if list_key is not None and label[last_of_list[list_key]] <= label[after]:
+                last_of_list[list_key] = node
+        if class_key is not None:
+            last_of_class[class_key] = node
+
+    order = []
+    node = head
+    while node is not None:
+        order.append(node)
+        node = next_node[node]
+    combined = pd.concat([thesauri_choices, odk_choices], ignore_index=True)
+    return combined.iloc[order].reset_index(drop=True)
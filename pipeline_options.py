@@ -0,0 +1,73 @@
+# =======================
+# Settings shared by the scripts and the pipeline runner
+# =======================
+
+import os
+import sys
+
+# Lists always copied from the thesauri into the Arches spreadsheet, even though they are not in Arches
+FORCED_LIST_NAMES = ['artefacts_cultural_period', 'artefacts_cultural_period_certainity']
+
+# Similarity needed for a close match (difflib ratio)
+CLOSE_MATCH_CUTOFF = 0.8
+
+# Batch (unattended) mode:
+#
+# The runner sets these environment variables, so they apply whether a script runs in the
+# runner's process or on its own:
+#   THESAURI_BATCH=1                  no prompts, use the limits below instead
+#   THESAURI_MAX_LIST_NONMATCHES=N    script 1 fails if more list names than N do not match
+#   THESAURI_MAX_NONMATCHES=N         script 2 fails if more concepts than N do not match
+
+# How script 5 writes the concepts to the CDB (THESAURI_CDB_MODE):
+#   replace  back up, empty and refill mahsa_thesauri in place (default)
+#   swap     load a staging table, then rename it to mahsa_thesauri in one short transaction
+#   delta    insert, update and delete only the concepts that changed (THESAURI_CDB_DELTA_KEY
+#            says how rows are matched: 'concept' for list_name + concept_key (default), or 'id',
+#            which is refused when the ids of script 2 have moved to other concepts)
+CDB_LOAD_MODES = ["replace", "swap", "delta"]
+CDB_DELTA_KEYS = {"id": ["id"], "concept": ["list_name", "concept_key"]}
+# Number of earlier versions of mahsa_thesauri kept as snapshots (THESAURI_CDB_SNAPSHOTS)
+CDB_SNAPSHOTS_TO_KEEP = 5
+
+
+def batch_mode():
+    """True when the scripts must not prompt (THESAURI_BATCH set to 1 / yes / true)."""
+    return os.getenv("THESAURI_BATCH", "").strip().lower() in ("1", "yes", "true")
+
+
+def nonmatch_limit(env_var, default=0):
+    """Highest number of non-matches allowed in batch mode."""
+    value = os.getenv(env_var)
+    return int(value) if value not in (None, "") else default
+
+
+def check_nonmatch_limit(count, env_var, what):
+    """In batch mode, stop with exit code 1 if count is above the limit set in env_var."""
+    limit = nonmatch_limit(env_var)
+    if count > limit:
+        print(f"❌ {count} {what} do not match (limit {limit}, {env_var}). Stopping.")
+        sys.exit(1)
+    print(f"✅ {count} {what} do not match (limit {limit}). Continuing.")
+
+
+def cdb_load_mode():
+    """Script 5 load mode from THESAURI_CDB_MODE (default 'replace')."""
+    mode = os.getenv("THESAURI_CDB_MODE", "").strip().lower() or "replace"
+    if mode not in CDB_LOAD_MODES:
+        raise ValueError(f"THESAURI_CDB_MODE must be one of {', '.join(CDB_LOAD_MODES)}, not {mode!r}")
+    return mode
+
+
+def cdb_delta_key():
+    """Columns matching CDB rows to new concepts in delta mode, from THESAURI_CDB_DELTA_KEY."""
+    name = os.getenv("THESAURI_CDB_DELTA_KEY", "").strip().lower() or "concept"
+    if name not in CDB_DELTA_KEYS:
+        raise ValueError(f"THESAURI_CDB_DELTA_KEY must be one of {', '.join(CDB_DELTA_KEYS)}, not {name!r}")
+    return CDB_DELTA_KEYS[name]
+
+
+def cdb_snapshots_to_keep():
+    """Number of mahsa_thesauri snapshots to keep, from THESAURI_CDB_SNAPSHOTS."""
+    value = os.getenv("THESAURI_CDB_SNAPSHOTS", "").strip()
+    return int(value) if value else CDB_SNAPSHOTS_TO_KEEP
@@ -0,0 +1,222 @@
+# =======================
+# Timings, memory and row / file counts of the pipeline steps, and an optional profile
+# =======================
+#
+# The scripts wrap their main steps in `with step("fuzzy match") as s:` and note what the step
+# handled: s.rows_in, s.rows_out, s.read(path), s.wrote(path). Each step records its wall time,
+# CPU time (with finished worker processes), the peak RSS of the process so far, and the size of
+# the files it read and wrote.
+#
+# The runner writes every step of a run to a JSON report (see --metrics-report). A script run on
+# its own writes one if THESAURI_METRICS_REPORT is set to a path.
+#
+# THESAURI_PROFILE=<script number or step name> (--profile in the runner) runs that script or
+# step under cProfile. The profile is saved as a .prof file next to the report (or in the
+# working folder), and its slowest functions are printed.
+
+import atexit
+import cProfile
+import datetime
+import io
+import json
+import os
+import platform
+import pstats
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILE_LINES = 25
+
+_run = {
+    "started": datetime.datetime.now().isoformat(timespec="seconds"),
+    "argv": sys.argv,
+    "python": platform.python_version(),
+    "platform": platform.platform(),
+    "stages": [],
+    "steps": [],
+}
+_report_path = os.getenv("THESAURI_METRICS_REPORT", "").strip() or None
+_stage = None
+
+
+def _cpu_seconds():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def peak_rss_mb():
+    """Highest resident memory of this process so far, in MB (None if it cannot be read)."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return round(counters.PeakWorkingSetSize / (1024 * 1024), 1)
+    return None
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _profile_target():
+    return os.getenv("THESAURI_PROFILE", "").strip().lower() or None
+
+
+def _slug(name):
+    return re.sub(r"[^a-z0-9]+", "_", str(name).lower()).strip("_")
+
+
+@contextmanager
+def _profiled(name):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        folder = os.path.dirname(os.path.abspath(_report_path)) if _report_path else os.getcwd()
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"profile_{_slug(name)}_{datetime.datetime.now():%Y%m%d_%H%M%S}.prof")
+        profiler.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        print(f"Profile of {name} saved to {path}. Slowest functions (cumulative):")
+        print(text.getvalue())
+
+
+class Step:
+    """Measurements of one named step. Set rows_in / rows_out and call read() / wrote() for its files."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def read(self, *paths):
+        """Count the size of files the step read."""
+        self.bytes_read += sum(_file_size(p) for p in paths)
+
+    def wrote(self, *paths):
+        """Count the size of files the step wrote (call once they are complete)."""
+        self.bytes_written += sum(_file_size(p) for p in paths)
+
+
+def _stage_name():
+    if _stage is not None:
+        return _stage["stage"]
+    return os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else None
+
+
+@contextmanager
+def step(name, rows_in=None):
+    """Measure the code inside the with block as the step name."""
+    s = Step(name)
+    s.rows_in = rows_in
+    started, cpu_started = time.perf_counter(), _cpu_seconds()
+    profile = _profiled(name) if _profile_target() == name.lower() else None
+    status = "failed"
+    try:
+        if profile is not None:
+            with profile:
+                yield s
+        else:
+            yield s
+        status = "ok"
+    finally:
+        _run["steps"].append({
+            "stage": _stage_name(),
+            "step": name,
+            "status": status,
+            "wall_s": round(time.perf_counter() - started, 3),
+            "cpu_s": round(_cpu_seconds() - cpu_started, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "rows_in": s.rows_in,
+            "rows_out": s.rows_out,
+            "bytes_read": s.bytes_read,
+            "bytes_written": s.bytes_written,
+        })
+
+
+@contextmanager
+def stage(number, name):
+    """Measure a whole script (run by the runner) as stage number; its steps are recorded under name."""
+    global _stage
+    _stage = {"stage": name, "number": number, "status": "failed"}
+    started, cpu_started = time.perf_counter(), _cpu_seconds()
+    profile = _profiled(name) if _profile_target() == str(number) else None
+    try:
+        if profile is not None:
+            with profile:
+                yield _stage
+        else:
+            yield _stage
+    finally:
+        _stage.update({
+            "wall_s": round(time.perf_counter() - started, 3),
+            "cpu_s": round(_cpu_seconds() - cpu_started, 3),
+            "peak_rss_mb": peak_rss_mb(),
+        })
+        _run["stages"].append(_stage)
+        _stage = None
+
+
+def set_report_path(path):
+    """Write the run report to path when the process exits."""
+    global _report_path
+    _report_path = path
+
+
+def write_report(path=None):
+    """Write the stages and steps recorded so far as JSON. Returns the path, or None if there is nothing."""
+    path = path or _report_path
+    if not path or not (_run["steps"] or _run["stages"]):
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    report = dict(_run, finished=datetime.datetime.now().isoformat(timespec="seconds"))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    return path
+
+
+def print_summary():
+    """One line per recorded step."""
+    for s in _run["steps"]:
+        rows = f"{s['rows_in'] if s['rows_in'] is not None else '-'} -> {s['rows_out'] if s['rows_out'] is not None else '-'}"
+        print(f"  {s['stage'] or '':<45} {s['step']:<28} {s['wall_s']:9.2f} s  {s['cpu_s']:9.2f} s CPU  "
+              f"{s['peak_rss_mb'] or 0:7.0f} MB  rows {rows}")
+
+
+def _write_at_exit():
+    path = write_report()
+    if path:
+        print(f"📊 Run report saved to {path}")
+
+
+atexit.register(_write_at_exit)
@@ -0,0 +1,133 @@
+# =======================
+# Content-hash cache of pipeline stage outputs
+# =======================
+#
+# A stage's key is a hash of the contents of its input files, its parameters and the code of
+# the scripts. When a stage is run again with the same key, its stored output files are copied
+# back into place instead of running it. Entries are evicted by age and by count.
+
+import datetime
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+CACHE_META = "cache_entry.json"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """sha256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def code_digest(code_dir):
+    """sha256 of every .py file in code_dir, so changing any script invalidates the cache."""
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(code_dir, "*.py"))):
+        h.update(os.path.basename(path).encode("utf-8"))
+        h.update(file_digest(path).encode("ascii"))
+    return h.hexdigest()
+
+
+class StageCache:
+    def __init__(self, cache_dir, max_entries=20, max_age_days=30):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+
+    def key(self, stage, input_paths, params):
+        """
+        Fingerprint of a stage run: its name, the contents of its input files and its parameters
+        (anything JSON serialisable). Returns None if an input file is missing.
+        """
+        h = hashlib.sha256(stage.encode("utf-8"))
+        for path in input_paths:
+            if not os.path.exists(path):
+                return None
+            h.update(file_digest(path).encode("ascii"))
+        h.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+        return h.hexdigest()
+
+    def _entry_dir(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage}-{key[:32]}")
+
+    def restore(self, stage, key, outputs):
+        """
+        Copy the stored outputs of a stage run back to their paths. outputs maps output names
+        to the paths to write. Returns True on a cache hit.
+        """
+        entry = self._entry_dir(stage, key)
+        meta_path = os.path.join(entry, CACHE_META)
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        # Only an entry with every output of the stage counts (a stage that stopped early may
+        # have written some of them)
+        if meta.get("key") != key or set(meta["files"]) != set(outputs):
+            return False
+
+        for name, stored_name in meta["files"].items():
+            os.makedirs(os.path.dirname(outputs[name]), exist_ok=True)
+            shutil.copy2(os.path.join(entry, stored_name), outputs[name])
+
+        # Keep recently used entries
+        meta["last_used"] = datetime.datetime.now().isoformat()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return True
+
+    def store(self, stage, key, outputs, since=None):
+        """
+        Store the output files of a stage run. Nothing is stored (returns False) unless every
+        output exists and was written after the time.time() value since, so outputs left over
+        from older runs are never stored as this run's.
+        """
+        for path in outputs.values():
+            if not os.path.exists(path) or (since is not None and os.path.getmtime(path) < since):
+                return False
+
+        entry = self._entry_dir(stage, key)
+        tmp_entry = entry + ".tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+
+        files = {}
+        for name, path in outputs.items():
+            stored_name = name + os.path.splitext(path)[1]
+            shutil.copy2(path, os.path.join(tmp_entry, stored_name))
+            files[name] = stored_name
+
+        now = datetime.datetime.now().isoformat()
+        with open(os.path.join(tmp_entry, CACHE_META), "w", encoding="utf-8") as f:
+            json.dump({"stage": stage, "key": key, "created": now, "last_used": now, "files": files}, f, indent=2)
+
+        # Replace any older entry for the same key in one step
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+        self.evict()
+        return True
+
+    def evict(self):
+        """Remove entries older than max_age_days, then the least recently used beyond max_entries."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            meta_path = os.path.join(self.cache_dir, name, CACHE_META)
+            if not os.path.exists(meta_path):
+                continue
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            entries.append((meta["last_used"], meta["created"], os.path.join(self.cache_dir, name)))
+
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=self.max_age_days)).isoformat()
+        entries.sort(reverse=True)  # most recently used first
+        for i, (_, created, path) in enumerate(entries):
+            if created < cutoff or i >= self.max_entries:
+                shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The scripts' modules and the synthetic data generator are imported from the repository folder
+for path in (REPO_DIR, os.path.join(REPO_DIR, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def conn(request):
+    """
+    Connection to the database set in the DB_* variables (the test is skipped without one), with
+    the test module's TABLE created from its TABLE_DEFINITION. TABLE and every table named after
+    it (snapshots, versions, ...) are dropped before and after the test.
+    """
+    psycopg2 = pytest.importorskip("psycopg2")
+    try:
+        conn = psycopg2.connect(dbname=os.getenv("DB_NAME"), user=os.getenv("DB_USER"),
+                                password=os.getenv("DB_PASSWORD"), host=os.getenv("DB_HOST"),
+                                port=os.getenv("DB_PORT"), connect_timeout=5)
+    except psycopg2.Error as e:
+        pytest.skip(f"No test database: {e}")
+    table = request.module.TABLE
+    _drop_tables(conn, table)
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TABLE {table} ({request.module.TABLE_DEFINITION});")
+    conn.commit()
+    yield conn
+    conn.rollback()
+    _drop_tables(conn, table)
+    conn.close()
+
+
+def _drop_tables(conn, table):
+    schema, _, name = table.rpartition(".")
+    with conn.cursor() as cur:
+        cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = %s AND tablename LIKE %s;",
+                    (schema or "public", name + "%"))
+        for (found,) in cur.fetchall():
+            cur.execute(f'DROP TABLE IF EXISTS {schema or "public"}."{found}" CASCADE;')
+    conn.commit()
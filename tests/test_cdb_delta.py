@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from cdb_load import delta_upsert
+
+TABLE = "public.test_delta_thesauri"
+TABLE_DEFINITION = """id integer PRIMARY KEY, concept_key varchar(255), concept_value varchar(255), definition text,
+                      list_name varchar(255), bulk_import varchar(255)"""
+
+
+def concepts(keys_by_list):
+    """Complete concepts numbered 1..N in order, as script 2 numbers them."""
+    rows = [(list_name, key) for list_name, keys in keys_by_list.items() for key in keys]
+    return pd.DataFrame({
+        "id": range(1, len(rows) + 1),
+        "concept_key": [key for _, key in rows],
+        "concept_value": [key.lower() for _, key in rows],
+        "definition": [f"Definition of {key}" for _, key in rows],
+        "list_name": [list_name for list_name, _ in rows],
+        "bulk_import": [list_name for list_name, _ in rows],
+    })
+
+
+def table_rows(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT list_name, concept_key, id FROM {TABLE} ORDER BY id;")
+        return cur.fetchall()
+
+
+def test_concept_inserted_mid_list_is_the_only_change(conn):
+    delta_upsert(conn, concepts({"a": ["A1", "A2", "A3"], "b": ["B1", "B2"]}), table=TABLE)
+    before = table_rows(conn)
+
+    # A2b shifts the script 2 id of every later concept
+    changes, _ = delta_upsert(conn, concepts({"a": ["A1", "A2", "A2b", "A3"], "b": ["B1", "B2"]}), table=TABLE)
+
+    assert changes == {"a": {"inserted": 1, "updated": 0, "deleted": 0}}
+    after = table_rows(conn)
+    assert after[:len(before)] == before  # existing rows keep their ids
+    assert after[-1] == ("a", "A2b", 6)
+
+
+def test_id_key_refused_when_ids_moved(conn):
+    delta_upsert(conn, concepts({"a": ["A1", "A2", "A3"]}), table=TABLE)
+    before = table_rows(conn)
+
+    with pytest.raises(ValueError, match="belong to other concepts"):
+        delta_upsert(conn, concepts({"a": ["A1", "A1b", "A2", "A3"]}), table=TABLE, key=("id",))
+    assert table_rows(conn) == before
+
+
+def test_id_key_updates_changed_values(conn):
+    delta_upsert(conn, concepts({"a": ["A1", "A2"]}), table=TABLE, key=("id",))
+    df = concepts({"a": ["A1", "A2"]})
+    df.loc[1, "definition"] = "New definition"
+
+    changes, _ = delta_upsert(conn, df, table=TABLE, key=("id",))
+    assert changes == {"a": {"inserted": 0, "updated": 1, "deleted": 0}}
@@ -0,0 +1,15 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from cdb_export import export_table_csv
+
+TABLE = "public.test_export_thesauri"
+TABLE_DEFINITION = "id integer PRIMARY KEY, definition text"
+
+
+def test_export_counts_rows_not_lines(conn, tmp_path):
+    with conn.cursor() as cur:
+        cur.execute(f"INSERT INTO {TABLE} VALUES (1, 'one line'), (2, E'two\\nlines'), (3, NULL);")
+    conn.commit()
+    assert export_table_csv(conn, TABLE, str(tmp_path / "export.csv"), order_by="id") == 3
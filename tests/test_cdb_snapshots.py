@@ -0,0 +1,129 @@
+import pandas as pd
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from cdb_load import load_staging
+from cdb_snapshots import prune_snapshots, swap_new_version
+
+TABLE = "public.test_snap_thesauri"
+STAGING = TABLE + "_staging"
+# A serial id: its sequence is owned by the table and used by the id default
+TABLE_DEFINITION = """id serial PRIMARY KEY, concept_key varchar(255), concept_value varchar(255), definition text,
+                      list_name varchar(255), bulk_import varchar(255)"""
+
+
+def concepts(n):
+    return pd.DataFrame({"id": range(1, n + 1), "concept_key": [f"K{i}" for i in range(n)],
+                         "concept_value": "v", "definition": "d", "list_name": "a", "bulk_import": "a"})
+
+
+def swap(conn, n, keep=1):
+    load_staging(conn, concepts(n), TABLE, STAGING)
+    return swap_new_version(conn, "test.csv", n, TABLE, STAGING, keep=keep)
+
+
+def insert_without_id(conn):
+    with conn.cursor() as cur:
+        # The loads give explicit ids, so move the sequence past them first
+        cur.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), max(id)) FROM {TABLE};", (TABLE,))
+        cur.execute(f"INSERT INTO {TABLE} (concept_key, list_name) VALUES ('new', 'a') RETURNING id;")
+        new_id = cur.fetchone()[0]
+    conn.rollback()
+    return new_id
+
+
+def sequence_owner(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id');", (TABLE,))
+        return cur.fetchone()[0]
+
+
+def test_snapshots_age_out_after_swaps(conn):
+    for n in (3, 4, 5):
+        swap(conn, n)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM {TABLE};")
+        assert cur.fetchone()[0] == 5
+    assert sequence_owner(conn) is not None  # the live table owns its id sequence
+    assert insert_without_id(conn) is not None
+
+
+def test_prune_moves_sequence_left_on_snapshot(conn):
+    swap(conn, 3, keep=5)
+    # As after a swap that did not move the sequence: the snapshot still owns it
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id');", (TABLE + "_v1",))
+        assert cur.fetchone()[0] is None
+        cur.execute(f"ALTER SEQUENCE public.test_snap_thesauri_id_seq OWNED BY {TABLE}_v1.id;")
+    conn.commit()
+
+    with conn.cursor() as cur:
+        assert prune_snapshots(cur, TABLE, keep=0) == [1]
+    conn.commit()
+    assert sequence_owner(conn) is not None
+    assert insert_without_id(conn) is not None
+
+
+def delta_load(conn, keys, definition="d"):
+    from cdb_load import delta_upsert
+    from cdb_snapshots import live_version, record_load, snapshot_changes
+
+    df = pd.DataFrame({"id": range(1, len(keys) + 1), "concept_key": keys, "concept_value": "v",
+                       "definition": [f"{definition} {key}" for key in keys], "list_name": "a", "bulk_import": "a"})
+
+    def record_new_version(c):
+        snapshot_changes(c, TABLE)
+        record_load(c, TABLE, "test.csv", len(df))
+        prune_snapshots(c, TABLE, keep=5)
+
+    delta_upsert(conn, df, TABLE, before_write=lambda c: live_version(c, TABLE), after_write=record_new_version)
+
+
+def contents(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT id, concept_key, definition FROM {TABLE} ORDER BY id;")
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def test_delta_versions_keep_only_changed_rows_and_restore(conn):
+    from cdb_snapshots import restore_version
+
+    delta_load(conn, ["A", "B", "C"])  # version 2 (version 1 is the empty table)
+    v2 = contents(conn)
+    delta_load(conn, ["A", "A2", "B", "C"])  # version 3: one insert
+    v3 = contents(conn)
+    delta_load(conn, ["A", "A2", "C"])  # version 4: one delete
+    v4 = contents(conn)
+    delta_load(conn, ["A", "A2", "C"], definition="new")  # version 5: three updates
+    # The changed rows are kept by the version they replaced
+    with conn.cursor() as cur:
+        cur.execute(f"""SELECT version, change, concept_key, definition FROM {TABLE}_changes WHERE version > 1
+                        ORDER BY version, concept_key;""")
+        assert cur.fetchall() == [(2, "inserted", "A2", "d A2"), (3, "deleted", "B", "d B"),
+                                  (4, "updated", "A", "d A"), (4, "updated", "A2", "d A2"), (4, "updated", "C", "d C")]
+    conn.commit()
+
+    restore_version(conn, 2, TABLE, STAGING)
+    assert contents(conn) == v2
+    restore_version(conn, 3, TABLE, STAGING)
+    assert contents(conn) == v3
+    restore_version(conn, 4, TABLE, STAGING)
+    assert contents(conn) == v4
+
+
+def test_failed_replace_keeps_the_table(conn):
+    from cdb_snapshots import replace_new_version
+
+    replace_new_version(conn, concepts(3), "test.csv", TABLE)
+    before = contents(conn)
+    bad = concepts(3)
+    bad.loc[2, "id"] = 1  # duplicate primary key
+    with pytest.raises(psycopg2.IntegrityError):
+        replace_new_version(conn, bad, "bad.csv", TABLE)
+    assert contents(conn) == before
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT source_csv FROM {TABLE}_versions WHERE snapshot_table IS NULL;")
+        assert cur.fetchall() == [("test.csv",)]
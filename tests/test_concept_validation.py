@@ -0,0 +1,20 @@
+import pandas as pd
+
+from concept_validation import validate_concepts
+
+
+def concepts(bulk_import, definition):
+    return pd.DataFrame({
+        "id": [1, 2], "list_name": ["colour", "colour"], "concept_key": ["Red", "Blue"],
+        "ODK_list_name": ["colour", "colour"], "odk_value": ["red", "blue"], "list_order": [1, 2],
+        "bulk_import": bulk_import, "definition": definition,
+    })
+
+
+def test_blank_definition_allowed_when_bulk_import_is_the_list_name():
+    assert validate_concepts(concepts(["colour", "colour"], ["A red", None])) == []
+
+
+def test_blank_definition_fails_where_a_bi_name_is_set():
+    failures = validate_concepts(concepts(["colour_bi", "colour_bi"], ["A red", None]))
+    assert [(f.check, f.count) for f in failures] == [("Blank definition where a BI Name is set", 1)]
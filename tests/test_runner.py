@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+
+import synthetic_data
+import thesauri_paths
+from conftest import REPO_DIR
+from stage_cache import CACHE_META, StageCache
+
+RUNNER = os.path.join(REPO_DIR, "thesauri_update_run_all_scripts.py")
+
+
+def run_runner(root, cache_dir, answers):
+    """Run scripts 1-3 with the runner on the inputs at root, answering its prompts with answers."""
+    env = {k: v for k, v in os.environ.items() if not k.startswith("THESAURI_")}
+    env.update({"MAHSA_DATABASE_DIR": root, "PYTHONUNBUFFERED": "1"})
+    return subprocess.run([sys.executable, RUNNER, "--to", "3", "--cache-dir", cache_dir], input=answers,
+                          text=True, capture_output=True, cwd=REPO_DIR, env=env, timeout=600)
+
+
+def complete_concepts_files(root):
+    folder = os.path.join(root, os.path.relpath(thesauri_paths.COMPLETE_CONCEPTS_DIR, thesauri_paths.MAHSA_DATABASE_DIR))
+    return os.listdir(folder) if os.path.isdir(folder) else []
+
+
+def test_declining_at_script_2_stops_the_run_and_is_not_cached(tmp_path):
+    root = str(tmp_path / "MAHSA_Database")
+    cache_dir = str(tmp_path / "cache")
+    synthetic_data.generate(root, 200)
+
+    # Go on after script 1, then answer N at script 2's prompt
+    result = run_runner(root, cache_dir, "y\nN\n")
+    assert result.returncode == 1, result.stdout + result.stderr
+    assert "stopped by user" in result.stdout
+    assert "Running 3_bi_spreadsheet_concept_update.py" not in result.stdout
+    assert complete_concepts_files(root) == []
+    entries = os.listdir(cache_dir)
+    assert any(e.startswith("list_names-") for e in entries)
+    assert not any(e.startswith("concepts-") for e in entries)
+
+    # The next run reuses script 1 but runs script 2 again, prompt included
+    result = run_runner(root, cache_dir, "y\nY\ny\n")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "Reused its outputs" in result.stdout
+    assert "Do you want to continue and create the complete thesauri concepts CSV?" in result.stdout
+    assert complete_concepts_files(root)
+
+
+def test_store_needs_every_output(tmp_path):
+    cache = StageCache(str(tmp_path / "cache"))
+    written = tmp_path / "written.txt"
+    written.write_text("new")
+    outputs = {"written": str(written), "missing": str(tmp_path / "missing.txt")}
+
+    assert not cache.store("stage", "k" * 64, outputs)
+    assert not cache.restore("stage", "k" * 64, outputs)
+
+
+def test_restore_rejects_an_entry_without_every_output(tmp_path):
+    cache = StageCache(str(tmp_path / "cache"))
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    a.write_text("a")
+    b.write_text("b")
+    key = "k" * 64
+    assert cache.store("stage", key, {"a": str(a)})
+
+    # An entry stored before the stage had output b (or by a stage that stopped early)
+    assert not cache.restore("stage", key, {"a": str(a), "b": str(b)})
+    assert cache.restore("stage", key, {"a": str(a)})
+    entry = os.path.join(cache.cache_dir, os.listdir(cache.cache_dir)[0], CACHE_META)
+    with open(entry, encoding="utf-8") as f:
+        assert json.load(f)["files"] == {"a": "a.txt"}
@@ -0,0 +1,108 @@
+# =======================
+# Single-pass parser for the thesauri sheet block layout
+# =======================
+#
+# Each list in the thesauri workbook is a block of marker rows followed by its concepts:
+#
+#   Resource Model Node | <node name>         (or CDB List Name | <list name>)
+#   BI Name             | <bulk import name>
+#   ODK List Name       | <odk list name(s)> (or 'Not in ODK')
+#   ODK Value           | <concept header row>
+#   <odk value>         | <concept> | <definition> | <list order> | ... | <ODK multi>
+#
+# The parser walks the rows once and resolves the list name, BI name and ODK list name
+# of every concept as it goes.
+
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import pandas as pd
+
+from concept_model import normalise_name
+
+# Marker rows that set the list_name of the rows that follow
+LIST_NAME_LABELS = ('Resource Model Node', 'CDB List Name')
+
+# Marker / header rows that are not concepts
+MARKER_LABELS = ('Resource Model Node', 'CDB List Name', 'ODK List Name', 'BI Name', 'Legacy Data Column', 'ODK Value')
+
+# Column names of the processed thesauri frame, in ConceptRecord field order
+THESAURI_COLUMNS = ["odk_value", "concept_key", "definition", "list_order", "ODK_multi", "list_name",
+                    "concept_value", "bulk_import", "ODK_list_name"]
+
+
+@dataclass
+class ConceptRecord:
+    odk_value: Any
+    concept_key: Any
+    definition: Any
+    list_order: Any
+    odk_multi: Any
+    list_name: Optional[str]
+    concept_value: Any
+    bulk_import: Optional[str]
+    odk_list_name: Optional[str]
+
+
+def _missing(value):
+    return value is None or (not isinstance(value, str) and pd.isna(value))
+
+
+def parse_thesauri_blocks(rows):
+    """
+    Parse thesauri rows (sequences whose first 8 cells are the sheet columns A-H) in one pass.
+
+    Returns (records, cdb_list_names): a list of ConceptRecord, one per concept row, and the
+    normalised list names that were tagged 'CDB List Name', in order of first appearance.
+    """
+    records = []
+    cdb_list_names = []
+    seen_cdb = set()
+
+    list_name = None
+    # BI / ODK list names are remembered per list name, so a list that appears again later
+    # in the workbook (without its own BI Name / ODK List Name rows) keeps the names set earlier
+    bi_names = {}
+    odk_list_names = {}
+
+    for row in rows:
+        label, value = row[0], row[1]
+        if isinstance(label, str) and label == '':
+            label = None
+
+        if label in LIST_NAME_LABELS and not _missing(value):
+            list_name = value
+            if label == 'CDB List Name' and value not in seen_cdb:
+                seen_cdb.add(value)
+                cdb_list_names.append(normalise_name(value))
+        elif label == 'BI Name' and list_name is not None and not _missing(value):
+            bi_names[list_name] = value
+        elif label == 'ODK List Name' and list_name is not None and not _missing(value):
+            odk_list_names[list_name] = value
+
+        if label in MARKER_LABELS or (_missing(label) and _missing(value)):
+            continue
+
+        bi_name = bi_names.get(list_name, list_name) if list_name is not None else None
+        odk_list_name = odk_list_names.get(list_name) if list_name is not None else None
+        if odk_list_name is not None:
+            odk_list_name = '' if odk_list_name == 'Not in ODK' else str(odk_list_name)
+
+        records.append(ConceptRecord(
+            odk_value=None if _missing(label) else label,
+            concept_key=None if _missing(value) else value,
+            definition=None if _missing(row[2]) else row[2],
+            list_order=None if _missing(row[3]) else row[3],
+            odk_multi=None if _missing(row[7]) else row[7],
+            list_name=normalise_name(list_name),
+            concept_value=None if _missing(value) else value,
+            bulk_import=normalise_name(bi_name),
+            odk_list_name=odk_list_name,
+        ))
+
+    return records, cdb_list_names
+
+
+def records_to_frame(records):
+    """Build the processed thesauri frame (THESAURI_COLUMNS) from ConceptRecords."""
+    return pd.DataFrame([tuple(vars(r).values()) for r in records], columns=THESAURI_COLUMNS, dtype=object)
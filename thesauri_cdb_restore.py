@@ -0,0 +1,48 @@
+import argparse
+import sys
+
+import pandas as pd
+
+from cdb_session import get_connection, release
+from cdb_snapshots import list_versions, restore_version
+from pipeline_options import cdb_snapshots_to_keep
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="List the versions of mahsa_thesauri on the CDB, or swap a snapshot back in.")
+    parser.add_argument("version", type=int, nargs="?",
+                        help="Version to restore. Without it, the versions are listed.")
+    parser.add_argument("--keep", type=int, default=None,
+                        help="Number of snapshots to keep after the restore (default THESAURI_CDB_SNAPSHOTS or 5).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    conn = get_connection()
+    try:
+        if args.version is None:
+            versions = pd.DataFrame(list_versions(conn), dtype=object)
+            versions = versions.astype(object).where(versions.notna(), "")
+            if versions.empty:
+                print("No versions of mahsa_thesauri recorded yet.")
+            else:
+                with pd.option_context('display.max_columns', None, 'display.width', None):
+                    print(versions.to_string(index=False))
+            return
+
+        keep = args.keep if args.keep is not None else cdb_snapshots_to_keep()
+        try:
+            new_version = restore_version(conn, args.version, keep=keep)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"✅ Version {args.version} restored into mahsa_thesauri as version {new_version}. "
+              f"The replaced contents were kept as a snapshot.")
+    finally:
+        release(conn)
+
+
+if __name__ == "__main__":
+    main()
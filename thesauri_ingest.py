@@ -0,0 +1,76 @@
+# =======================
+# Single-pass ingest of the MAHSA thesauri workbook
+# =======================
+
+import openpyxl
+
+# Sheets that are not thesaurus lists and are never loaded
+SHEETS_TO_SKIP = [
+    'Temp Concept Sheet', 'Relationships', 'ODK Only', 'Guidelines',
+    'TempWorkSheet', 'PalaeolithicChronology (in prg)'
+]
+
+# Strings that pd.read_excel treats as missing by default, kept so the parsed rows match the old ingest
+_NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+}
+
+
+def _clean_value(value):
+    if isinstance(value, str) and value in _NA_STRINGS:
+        return None
+    return value
+
+
+def iter_sheet_rows(ws, n_cols=None):
+    """Yield the rows of a read-only sheet as tuples, without the trailing empty rows."""
+    # Don't trust the stored dimension, some exports write 'A1' for the whole sheet
+    ws.reset_dimensions()
+
+    pending_empty = 0
+    for row in ws.iter_rows(max_col=n_cols, values_only=True):
+        row = tuple(_clean_value(v) for v in row)
+        if all(v is None for v in row):
+            pending_empty += 1
+            continue
+        # Blank rows in between blocks are kept, like pd.read_excel does
+        for _ in range(pending_empty):
+            yield (None,) * len(row)
+        pending_empty = 0
+        yield row
+
+
+def copy_sheet(ws, output_path, title):
+    """Stream a read-only sheet into a new single-sheet workbook."""
+    out_wb = openpyxl.Workbook(write_only=True)
+    out_ws = out_wb.create_sheet(title)
+    for row in ws.iter_rows(values_only=True):
+        out_ws.append(row)
+    out_wb.save(output_path)
+
+
+def iter_thesauri_rows(workbook_path, skip_sheets=SHEETS_TO_SKIP, n_cols=8, odk_only_path=None):
+    """
+    Read every list sheet of the thesauri workbook once, in read-only mode, and yield
+    the rows of all sheets in order as n_cols-tuples (empty cells are None).
+
+    Sheets in skip_sheets are never parsed. If odk_only_path is given, the 'ODK Only'
+    sheet is copied there during the same pass.
+    """
+    workbook = openpyxl.load_workbook(workbook_path, read_only=True, data_only=True)
+    try:
+        print("Original sheets:", workbook.sheetnames)
+
+        if odk_only_path and 'ODK Only' in workbook.sheetnames:
+            copy_sheet(workbook['ODK Only'], odk_only_path, 'ODK Only')
+            print(f"Saved 'ODK Only' sheet to: {odk_only_path}")
+
+        sheet_names = [s for s in workbook.sheetnames if s not in skip_sheets]
+        print("Sheets to process:", sheet_names)
+
+        for sheet in sheet_names:
+            yield from iter_sheet_rows(workbook[sheet], n_cols)
+    finally:
+        workbook.close()
+
@@ -0,0 +1,44 @@
+# =======================
+# Folders and files used by the thesauri update scripts
+# =======================
+#
+# Everything lives under the MAHSA_Database folder on the shared drive. Set the
+# MAHSA_DATABASE_DIR environment variable to use another location (e.g. on a Linux host).
+
+import os
+
+MAHSA_DATABASE_DIR = os.getenv(
+    "MAHSA_DATABASE_DIR", r"D:\University of Cambridge\ARCH_MAHSA - General\MAHSA_Database"
+)
+
+# Inputs
+THESAURI_DIR = os.path.join(MAHSA_DATABASE_DIR, "Thesauri")
+THESAURI_WORKBOOK = os.path.join(THESAURI_DIR, "MAHSA_Thesauri_v5.xlsx")
+COMMON_BULK_IMPORT = os.path.join(MAHSA_DATABASE_DIR, "ArchesDataDigitization", "CommonDataSheets",
+                                  "Common_BulkImportSheet.xlsx")
+
+# Audit spreadsheets
+SPREADSHEETS_DIR = os.path.join(THESAURI_DIR, "Thesauri_Audit", "Spreadsheets")
+ARCHES_EXPORT = os.path.join(SPREADSHEETS_DIR, "arches_thesauri_export.xlsx")
+
+PROCESSING_DIR = os.path.join(SPREADSHEETS_DIR, "1_Processing")
+ODK_ONLY_PATH = os.path.join(PROCESSING_DIR, "excel_thesauri_ODK_only.xlsx")
+THESAURI_PROCESSED = os.path.join(PROCESSING_DIR, "excel_thesauri_processed.csv")
+ARCHES_PROCESSED = os.path.join(PROCESSING_DIR, "arches_thesauri_processed.xlsx")
+CDB_PROCESSED = os.path.join(PROCESSING_DIR, "CDB_thesauri_processed.csv")
+# Per-list close-match results of the last script 2 run, reused for unchanged lists
+CONCEPT_MATCH_STATE = os.path.join(PROCESSING_DIR, "concept_comparison_state.parquet")
+
+COMPARISON_DIR = os.path.join(SPREADSHEETS_DIR, "2_Comparison")
+LIST_NAME_COMPARISON = os.path.join(COMPARISON_DIR, "thesauri_arches_list_name_comparison.xlsx")
+CONCEPTS_COMPARISON = os.path.join(COMPARISON_DIR, "thesauri_arches_concepts_comparison.xlsx")
+
+COMPLETE_CONCEPTS_DIR = os.path.join(SPREADSHEETS_DIR, "3_Complete_concepts")
+BULKIMPORT_DIR = os.path.join(SPREADSHEETS_DIR, "4_Updated_MAHSA_BulkImport")
+ODK_CHOICES_DIR = os.path.join(SPREADSHEETS_DIR, "5_Updated_ODK_form", "Choices_sheets")
+ODK_MASTER_FORM_DIR = os.path.join(SPREADSHEETS_DIR, "5_Updated_ODK_form", "Master_ODK_site_form")
+
+
+def complete_concepts_path(date_str):
+    """Path of the complete concepts CSV for a YYYYMMDD date."""
+    return os.path.join(COMPLETE_CONCEPTS_DIR, f"complete_thesauri_concepts_{date_str}.csv")
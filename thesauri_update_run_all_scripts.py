@@ -1,5 +1,17 @@
-import subprocess
+import argparse
+import datetime
+import os
+import runpy
 import sys
+import time
+import traceback
+
+import artifacts
+import run_metrics
+import thesauri_paths
+from pipeline_options import FORCED_LIST_NAMES, CLOSE_MATCH_CUTOFF, CDB_LOAD_MODES, CDB_DELTA_KEYS
+from stage_cache import StageCache, code_digest
+from thesauri_ingest import SHEETS_TO_SKIP
 
 # List your scripts in order
 scripts = [
@@ -11,27 +23,198 @@ scripts = [
     "6_ODK_sheet_creator.py"
 ]
 
-for i, script in enumerate(scripts):
-    print(f"Running {script}...")
-
-    # Run the script
-    result = subprocess.run(["python", script])
-
-    if result.returncode != 0:
-        print(f"❌ Script {script} failed with return code {result.returncode}. Exiting.")
-        sys.exit(1)  # exit with non-zero code to indicate failure
-
-    # Only ask to continue if it's not the last script
-    if i < len(scripts) - 1:
-        while True:
-            user_input = input(f"{script} completed. Proceed to next script? (Y/N): ").strip().lower()
-            if user_input == 'y':
-                break
-            elif user_input == 'n':
-                print("Execution stopped by user.")
-                sys.exit(0)
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def cached_stages():
+    """
+    Input files and output files of the scripts whose results can be reused from the stage
+    cache (the others write to the CDB or create new dated workbooks every time).
+    """
+    p = thesauri_paths
+    parquet = artifacts.artifact_path
+    complete_csv = p.complete_concepts_path(datetime.date.today().strftime("%Y%m%d"))
+    list_name_outputs = {
+        "odk_only": p.ODK_ONLY_PATH,
+        "thesauri_processed": parquet(p.THESAURI_PROCESSED),
+        "arches_processed": parquet(p.ARCHES_PROCESSED),
+        "list_name_matches": parquet(p.LIST_NAME_COMPARISON),
+        "list_name_comparison": p.LIST_NAME_COMPARISON,
+    }
+    # A stage is only cached when it wrote every output, so the review copies are outputs only when they are written
+    if artifacts.review_exports_enabled():
+        list_name_outputs.update({
+            "thesauri_processed_csv": p.THESAURI_PROCESSED,
+            "arches_processed_xlsx": p.ARCHES_PROCESSED,
+        })
+    return {
+        1: {
+            "name": "list_names",
+            "inputs": [p.THESAURI_WORKBOOK, p.ARCHES_EXPORT],
+            "outputs": list_name_outputs,
+        },
+        2: {
+            "name": "concepts",
+            "inputs": [parquet(p.THESAURI_PROCESSED), parquet(p.ARCHES_PROCESSED), parquet(p.LIST_NAME_COMPARISON)],
+            "outputs": {
+                "concepts_comparison": p.CONCEPTS_COMPARISON,
+                "complete_concepts": parquet(complete_csv),
+                "complete_concepts_csv": complete_csv,
+                "concept_match_state": p.CONCEPT_MATCH_STATE,
+            },
+        },
+    }
+
+
+def stage_params(args):
+    """Settings that change what the cached stages produce."""
+    return {
+        "code": code_digest(script_dir),
+        "forced_list_names": FORCED_LIST_NAMES,
+        "close_match_cutoff": CLOSE_MATCH_CUTOFF,
+        "sheets_to_skip": SHEETS_TO_SKIP,
+        "review_exports": artifacts.review_exports_enabled(),
+        "batch": args.batch,
+        "max_list_nonmatches": args.max_list_nonmatches if args.batch else None,
+        "max_nonmatches": args.max_nonmatches if args.batch else None,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the thesauri update scripts in one process.")
+    parser.add_argument("--yes", "--batch", dest="batch", action="store_true",
+                        help="Run unattended: no prompts, stop on the non-match limits instead.")
+    parser.add_argument("--max-list-nonmatches", type=int, default=0,
+                        help="Batch mode: stop after script 1 if more list names than this do not match (default 0).")
+    parser.add_argument("--max-nonmatches", type=int, default=0,
+                        help="Batch mode: stop in script 2 if more concepts than this do not match (default 0).")
+    parser.add_argument("--from", dest="first", type=int, choices=range(1, len(scripts) + 1), default=1,
+                        help="Number of the first script to run (default 1).")
+    parser.add_argument("--to", dest="last", type=int, choices=range(1, len(scripts) + 1), default=len(scripts),
+                        help="Number of the last script to run (default 6).")
+    parser.add_argument("--cdb-mode", choices=CDB_LOAD_MODES,
+                        help="How script 5 writes to the CDB: 'replace' in place (default), 'swap' a staging table in, "
+                             "or 'delta' to write only the changed concepts.")
+    parser.add_argument("--cdb-delta-key", choices=CDB_DELTA_KEYS,
+                        help="Delta mode: match CDB rows by list_name + concept_key ('concept', default) or by 'id' "
+                             "(refused when the ids have moved to other concepts).")
+    parser.add_argument("--cdb-snapshots", type=int,
+                        help="Number of earlier versions of mahsa_thesauri kept on the CDB (default 5).")
+    parser.add_argument("--debug-exports", action="store_true",
+                        help="Also save the intermediate choices tables of script 6 (for debugging).")
+    parser.add_argument("--metrics-report",
+                        help="JSON file for the timings of the run (default: Spreadsheets/run_reports/"
+                             "thesauri_run_<date>_<time>.json).")
+    parser.add_argument("--profile", metavar="SCRIPT_OR_STEP",
+                        help="Run a script (number) or a named step (e.g. 'fuzzy match') under cProfile and "
+                             "save the profile next to the metrics report.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always run scripts 1 and 2, even when their inputs have not changed.")
+    parser.add_argument("--cache-dir", default=os.path.join(thesauri_paths.SPREADSHEETS_DIR, ".stage_cache"),
+                        help="Folder of the stage cache.")
+    parser.add_argument("--cache-max-entries", type=int, default=20,
+                        help="Number of cached stage results to keep (default 20).")
+    parser.add_argument("--cache-max-age-days", type=int, default=30,
+                        help="Drop cached stage results older than this (default 30 days).")
+    args = parser.parse_args(argv)
+    if args.first > args.last:
+        parser.error("--from must not be after --to")
+    return args
+
+
+def run_script(script):
+    """Run one script in this process. Returns True if it completed without errors."""
+    try:
+        runpy.run_path(os.path.join(script_dir, script), run_name="__main__")
+    except SystemExit as e:
+        # sys.exit() inside a script: only a non-zero code is a failure (scripts that stop early,
+        # e.g. when the user answers N, exit with code 1)
+        if e.code not in (None, 0):
+            print(f"Script {script} stopped with exit code {e.code}.")
+            return False
+    except Exception:
+        traceback.print_exc()
+        return False
+    return True
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Scripts import the shared modules next to them and read the batch settings from the environment
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    if args.batch:
+        os.environ["THESAURI_BATCH"] = "1"
+        os.environ["THESAURI_MAX_LIST_NONMATCHES"] = str(args.max_list_nonmatches)
+        os.environ["THESAURI_MAX_NONMATCHES"] = str(args.max_nonmatches)
+    if args.cdb_mode:
+        os.environ["THESAURI_CDB_MODE"] = args.cdb_mode
+    if args.cdb_delta_key:
+        os.environ["THESAURI_CDB_DELTA_KEY"] = args.cdb_delta_key
+    if args.cdb_snapshots is not None:
+        os.environ["THESAURI_CDB_SNAPSHOTS"] = str(args.cdb_snapshots)
+    if args.debug_exports:
+        os.environ["THESAURI_DEBUG_EXPORTS"] = "1"
+    if args.profile:
+        os.environ["THESAURI_PROFILE"] = args.profile
+
+    # Timings of every script and step, saved when the run ends (also when it stops early)
+    run_metrics.set_report_path(args.metrics_report or os.path.join(
+        thesauri_paths.SPREADSHEETS_DIR, "run_reports",
+        f"thesauri_run_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"))
+
+    # Keep each script's output frames in memory for the next script
+    artifacts.keep_in_memory(True)
+
+    cache = None
+    if not args.no_cache:
+        cache = StageCache(args.cache_dir, args.cache_max_entries, args.cache_max_age_days)
+        stages = cached_stages()
+        params = stage_params(args)
+
+    selected = scripts[args.first - 1:args.last]
+    for i, script in enumerate(selected):
+        number = args.first + i
+
+        # Reuse the stored outputs if the script's inputs and settings have not changed
+        stage = stages.get(number) if cache else None
+        with run_metrics.stage(number, script) as measured:
+            key = cache.key(stage["name"], stage["inputs"], params) if stage else None
+            if key and cache.restore(stage["name"], key, stage["outputs"]):
+                print(f"♻️  Inputs of {script} unchanged since a previous run. Reused its outputs.")
+                measured["status"] = "cached"
             else:
-                print("Please enter Y or N.")
+                print(f"Running {script}...")
+                started = time.time()
+                ok = run_script(script)
+                measured["status"] = "ok" if ok else "failed"
+
+                # Only a run that wrote all of its outputs is stored
+                if ok and key:
+                    cache.store(stage["name"], key, stage["outputs"], since=started)
+        if measured["status"] == "failed":
+            print(f"❌ Script {script} failed. Exiting.")
+            sys.exit(1)  # exit with non-zero code to indicate failure
+
+        # Only ask to continue if it's not the last script
+        if i < len(selected) - 1 and not args.batch:
+            while True:
+                user_input = input(f"{script} completed. Proceed to next script? (Y/N): ").strip().lower()
+                if user_input == 'y':
+                    break
+                elif user_input == 'n':
+                    print("Execution stopped by user.")
+                    sys.exit(0)
+                else:
+                    print("Please enter Y or N.")
+
+    # If all are completed successfully print message
+    print("✅ All scripts completed successfully.")
+    print("Time spent per step:")
+    run_metrics.print_summary()
+
 
-# If all are completed successfully print message
-print("✅ All scripts completed successfully.")
\ No newline at end of file
+# Guard needed because worker processes started by script 2 re-import this file on Windows
+if __name__ == "__main__":
+    main()
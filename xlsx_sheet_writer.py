@@ -0,0 +1,198 @@
+# =======================
+# Replace the data of one sheet in an .xlsx / .xlsm file, without Excel
+# =======================
+#
+# A workbook is a zip package with one XML part per sheet. The rows of the chosen sheet are
+# streamed into a new <sheetData> element; everything else in the sheet part (column widths,
+# views, data validations, ...) and every other part of the package (other sheets, styles,
+# macros in vbaProject.bin) is copied unchanged. Strings are written inline, so the shared
+# strings table is not touched. The calculation chain is dropped (Excel rebuilds it), and the
+# workbook can be flagged to recalculate all formulas the next time it is opened.
+
+import math
+import numbers
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+OFFICE_DOCUMENT_REL = REL_NS + "/officeDocument"
+CALC_CHAIN_REL = REL_NS + "/calcChain"
+
+# Characters not allowed in XML 1.0
+_ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_SHEET_DATA = re.compile(rb"<((?:\w+:)?)sheetData\b[^>]*?(?:/>|>.*?</\1sheetData>)", re.DOTALL)
+_DIMENSION = re.compile(rb"<((?:\w+:)?)dimension\b[^>]*?/>")
+_CALC_PR = re.compile(rb"<((?:\w+:)?)calcPr\b([^>]*?)(/?)>")
+# calcPr comes after these workbook elements, in this order
+_BEFORE_CALC_PR = re.compile(
+    rb"</(?:\w+:)?(?:sheets|functionGroups|externalReferences|definedNames)>|<(?:\w+:)?functionGroups\b[^>]*/>")
+
+ROWS_PER_CHUNK = 1000
+
+
+def _rels_path(part):
+    directory, name = posixpath.split(part)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+def _resolve(source_part, target):
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def _relationships(zf, part):
+    """{Id: (Type, resolved target part)} of a part."""
+    rels = ElementTree.fromstring(zf.read(_rels_path(part)))
+    return {r.get("Id"): (r.get("Type"), _resolve(part, r.get("Target")))
+            for r in rels.iter(f"{{{PKG_REL_NS}}}Relationship")}
+
+
+def _workbook_part(zf):
+    rels = ElementTree.fromstring(zf.read("_rels/.rels"))
+    for r in rels.iter(f"{{{PKG_REL_NS}}}Relationship"):
+        if r.get("Type") == OFFICE_DOCUMENT_REL:
+            return r.get("Target").lstrip("/")
+    return "xl/workbook.xml"
+
+
+def sheet_part(zf, sheet_name):
+    """Path inside the package of the XML part of sheet_name. KeyError if there is no such sheet."""
+    workbook = _workbook_part(zf)
+    root = ElementTree.fromstring(zf.read(workbook))
+    rels = _relationships(zf, workbook)
+    for sheet in root.iter(f"{{{MAIN_NS}}}sheet"):
+        if sheet.get("name") == sheet_name:
+            return rels[sheet.get(f"{{{REL_NS}}}id")][1]
+    raise KeyError(f"{sheet_name} sheet not found in workbook.")
+
+
+def _cell(ref, value, prefix):
+    # One <c> element, or "" for an empty cell (None, NaN, pd.NA, NaT)
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, (bool, np.bool_)):
+        return f'<{prefix}c r="{ref}" t="b"><{prefix}v>{int(value)}</{prefix}v></{prefix}c>'
+    if isinstance(value, numbers.Integral):
+        return f'<{prefix}c r="{ref}"><{prefix}v>{int(value)}</{prefix}v></{prefix}c>'
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        if not math.isinf(value):
+            return f'<{prefix}c r="{ref}"><{prefix}v>{value!r}</{prefix}v></{prefix}c>'
+    text = _ILLEGAL_XML_CHARS.sub("", str(value))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return (f'<{prefix}c r="{ref}" t="inlineStr"><{prefix}is><{prefix}t{space}>{escape(text)}'
+            f'</{prefix}t></{prefix}is></{prefix}c>')
+
+
+def _iter_sheet_data(columns, rows, prefix):
+    """Chunks of the new <sheetData> element: a header row, then one row per item of rows."""
+    letters = [get_column_letter(i) for i in range(1, len(columns) + 1)]
+    p = prefix.decode("ascii")
+    yield f"<{p}sheetData>"
+
+    def row_xml(r, values):
+        cells = "".join(_cell(f"{letter}{r}", v, p) for letter, v in zip(letters, values))
+        return f'<{p}row r="{r}">{cells}</{p}row>' if cells else ""
+
+    yield row_xml(1, columns)
+    chunk = []
+    for r, values in enumerate(rows, start=2):
+        chunk.append(row_xml(r, values))
+        if len(chunk) == ROWS_PER_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+    yield "".join(chunk)
+    yield f"</{p}sheetData>"
+
+
+def _flag_full_calc(workbook_xml):
+    # Ask Excel to recalculate every formula when the file is next opened
+    match = _CALC_PR.search(workbook_xml)
+    if match:
+        prefix, attrs, closing = match.groups()
+        attrs = re.sub(rb'\s+fullCalcOnLoad="[^"]*"', b"", attrs).rstrip()
+        return (workbook_xml[:match.start()] + b"<" + prefix + b"calcPr" + attrs + b' fullCalcOnLoad="1"'
+                + closing + b">" + workbook_xml[match.end():])
+    anchors = list(_BEFORE_CALC_PR.finditer(workbook_xml))
+    if not anchors:
+        return workbook_xml
+    prefix = re.match(rb"</?((?:\w+:)?)", anchors[-1].group()).group(1)
+    end = anchors[-1].end()
+    return workbook_xml[:end] + b"<" + prefix + b'calcPr fullCalcOnLoad="1"/>' + workbook_xml[end:]
+
+
+def _without_calc_chain(zf, workbook):
+    """(calcChain part or None, new workbook rels XML, new [Content_Types].xml) without the calc chain."""
+    calc_chain = next((target for rel_type, target in _relationships(zf, workbook).values()
+                       if rel_type == CALC_CHAIN_REL), None)
+    if calc_chain is None:
+        return None, None, None
+    rels_xml = re.sub(rb"<(?:\w+:)?Relationship\b[^>]*?Type=\"" + re.escape(CALC_CHAIN_REL.encode()) + rb"\"[^>]*?/>",
+                      b"", zf.read(_rels_path(workbook)))
+    types_xml = re.sub(rb"<(?:\w+:)?Override\b[^>]*?PartName=\"/" + re.escape(calc_chain.encode()) + rb"\"[^>]*?/>",
+                       b"", zf.read("[Content_Types].xml"))
+    return calc_chain, rels_xml, types_xml
+
+
+def replace_sheet(path, sheet_name, df, output_path=None, recalculate=False):
+    """
+    Write a copy of the workbook at path to output_path (default: path itself) in which the
+    cells of sheet_name are replaced by df: a header row with the column names, then its rows
+    from A2. Missing values become empty cells. Other sheets, macros and the sheet's own
+    formatting are kept. With recalculate, Excel recalculates all formulas on the next open.
+    """
+    output_path = output_path or path
+    tmp_path = output_path + ".tmp"
+    with zipfile.ZipFile(path) as zin:
+        part = sheet_part(zin, sheet_name)
+        workbook = _workbook_part(zin)
+        old_sheet = zin.read(part)
+        match = _SHEET_DATA.search(old_sheet)
+        if not match:
+            raise ValueError(f"{sheet_name} sheet has no cell data element.")
+        prefix = match.group(1)
+
+        n_rows = len(df) + 1
+        last_cell = f"{get_column_letter(max(len(df.columns), 1))}{n_rows}"
+        head = _DIMENSION.sub(lambda m: b"<" + m.group(1) + b'dimension ref="A1:' + last_cell.encode() + b'"/>',
+                              old_sheet[:match.start()], count=1)
+        tail = old_sheet[match.end():]
+
+        calc_chain, rels_xml, types_xml = _without_calc_chain(zin, workbook)
+        replaced = {_rels_path(workbook): rels_xml, "[Content_Types].xml": types_xml}
+        if recalculate:
+            replaced[workbook] = _flag_full_calc(zin.read(workbook))
+
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename == calc_chain:
+                    continue
+                out_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                out_info.compress_type = info.compress_type
+                out_info.external_attr = info.external_attr
+                if info.filename == part:
+                    out_info.compress_type = zipfile.ZIP_DEFLATED
+                    with zout.open(out_info, "w", force_zip64=True) as f:
+                        f.write(head)
+                        rows = df.itertuples(index=False, name=None)
+                        for chunk in _iter_sheet_data([str(c) for c in df.columns], rows, prefix):
+                            f.write(chunk.encode("utf-8"))
+                        f.write(tail)
+                elif replaced.get(info.filename) is not None:
+                    zout.writestr(out_info, replaced[info.filename])
+                else:
+                    with zin.open(info) as src, zout.open(out_info, "w", force_zip64=True) as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+    os.replace(tmp_path, output_path)